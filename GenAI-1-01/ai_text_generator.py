@@ -1,7 +1,16 @@
-from transformers import pipeline, set_seed
+from transformers import pipeline, set_seed, TextIteratorStreamer
 import torch
+import copy
+import gc
+import hashlib
+import json
+import os
 import re
-from typing import Any, Dict
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 def word_count(text: str) -> int:
     """
@@ -17,13 +26,714 @@ def word_count(text: str) -> int:
         raise TypeError("text должен быть строкой")
     return len(re.findall(r"[A-Za-zА-Яа-яЁё]+", text))
 
-def run_model(model_id: str, prompt: str, **gen_kwargs) -> Dict[str, Any]:
+def _model_memory_bytes(model) -> int:
+    """
+    Оценивает объем памяти, занимаемый весами и буферами модели.
+    Учитывает упакованные веса динамически квантованных слоев.
+
+    Параметры:
+        model: Загруженная модель PyTorch.
+
+    Возвращает:
+        int: Размер в байтах.
+    """
+    seen = set()
+
+    def size(value) -> int:
+        if isinstance(value, torch.Tensor):
+            # Связанные веса (например, wte и lm_head в GPT-2) учитываем один раз
+            if value.data_ptr() in seen:
+                return 0
+            seen.add(value.data_ptr())
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        return 0
+
+    return sum(size(value) for value in model.state_dict().values())
+
+
+# Режимы точности для CPU: имя -> тип весов ("int8" — динамическая квантизация Linear-слоев)
+PRECISIONS: Dict[str, Union[torch.dtype, str]] = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "int8": "int8",
+}
+
+
+# precision=None — тип весов transformers по умолчанию, т.е. fp32; в ключах кэшей оба
+# варианта приводятся к одному значению, чтобы одни и те же веса не загружались дважды
+DEFAULT_PRECISION = "fp32"
+
+
+def _precision_dtype(precision: Optional[str]) -> Union[torch.dtype, str, None]:
+    """Переводит имя режима точности в тип весов для кэша моделей (None — fp32)."""
+    if precision is None:
+        precision = DEFAULT_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision должен быть одним из {list(PRECISIONS)}, получено: {precision!r}")
+    return PRECISIONS[precision]
+
+
+def _quantize_int8(model):
+    """
+    Применяет динамическую int8-квантизацию ко всем Linear-слоям модели (только CPU).
+
+    В GPT-2 проекции внимания и MLP реализованы как transformers Conv1D (веса хранятся
+    транспонированными), поэтому сначала они заменяются эквивалентными nn.Linear.
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(module, name, linear)
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+# Инициализация моделей в transformers не потокобезопасна (общий контекст meta-устройства),
+# поэтому сборка pipeline сериализуется, а скачивание из Hub идет параллельно
+_MODEL_INIT_LOCK = threading.Lock()
+
+# Файлы, нужные pipeline из репозитория модели в Hub (без весов других фреймворков)
+_SNAPSHOT_PATTERNS = ["*.json", "*.txt", "*.model", "*.safetensors"]
+
+
+def _download_snapshot(model_id: str) -> str:
+    """
+    Скачивает модель из Hub в локальный кэш (или берет уже скачанную) и возвращает путь
+    к снимку. Для локальной папки, а также если скачать не удалось (например, нет сети),
+    возвращает model_id — ошибку тогда покажет сборка pipeline.
+    """
+    if os.path.isdir(model_id):
+        return model_id
+    try:
+        from huggingface_hub import snapshot_download
+
+        path = snapshot_download(model_id, allow_patterns=_SNAPSHOT_PATTERNS)
+        if not any(name.endswith(".safetensors") for name in os.listdir(path)):
+            path = snapshot_download(model_id, allow_patterns=_SNAPSHOT_PATTERNS + ["pytorch_model*.bin"])
+        return path
+    except Exception:
+        return model_id
+
+
+class GeneratorCache:
+    """
+    Процессный LRU-кэш загруженных text-generation pipeline.
+
+    Ключ кэша — (model_id, device_idx, dtype), где dtype — тип весов или "int8"
+    для динамически квантованной модели. Суммарный объем весов ограничен
+    бюджетом памяти: при его превышении вытесняются давно не использованные модели.
+    Модель, которая одна превышает бюджет, все равно остается в кэше, иначе
+    генерация была бы невозможна.
+    """
+
+    def __init__(self, max_memory_mb: Optional[float] = None):
+        self.max_memory_mb = max_memory_mb
+        self._items: "OrderedDict[Tuple[str, int, str], Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Блокировки загружаемых сейчас моделей: ключ -> threading.Lock
+        self._loading: Dict[Tuple[str, int, str], threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(model_id: str, device_idx: int, dtype: Union[torch.dtype, str, None]) -> Tuple[str, int, str]:
+        # dtype=None загружает веса в fp32 — тот же ключ, что и для torch.float32
+        return (model_id, device_idx, str(dtype if dtype is not None else PRECISIONS[DEFAULT_PRECISION]))
+
+    def get(self, model_id: str, device_idx: int, dtype: Union[torch.dtype, str, None] = None):
+        """
+        Возвращает pipeline из кэша, загружая модель при промахе.
+
+        Параметры:
+            model_id (str): Идентификатор модели в Hub или путь к локальной папке.
+            device_idx (int): Индекс устройства (-1 — CPU).
+            dtype (torch.dtype|str|None): Тип весов; "int8" — динамическая квантизация
+                (только CPU); None — тип по умолчанию (fp32, тот же ключ кэша).
+
+        Возвращает:
+            Pipeline: Готовый text-generation pipeline.
+        """
+        key = self._key(model_id, device_idx, dtype)
+        if dtype == "int8" and device_idx != -1:
+            raise ValueError("int8-квантизация поддерживается только на CPU (device_idx=-1)")
+        with self._lock:
+            generator = self._lookup(key)
+            if generator is not None:
+                return generator
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        # Модель загружается вне общей блокировки: обращения к уже загруженным моделям
+        # не ждут загрузки, а одну и ту же модель загружает только один поток
+        with loading:
+            with self._lock:
+                generator = self._lookup(key)
+                if generator is not None:
+                    return generator
+                self.misses += 1
+            try:
+                generator = self._load(model_id, device_idx, dtype)
+                with self._lock:
+                    self._items[key] = (generator, _model_memory_bytes(generator.model))
+                    self._shrink(keep=key)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return generator
+
+    def _lookup(self, key: Tuple[str, int, str]):
+        """Возвращает pipeline из кэша и обновляет порядок LRU (вызывается под self._lock)."""
+        if key not in self._items:
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return self._items[key][0]
+
+    @staticmethod
+    def _load(model_id: str, device_idx: int, dtype: Union[torch.dtype, str, None]):
+        """Загружает text-generation pipeline (без кэша): скачивание параллельно, сборка по очереди."""
+        path = _download_snapshot(model_id)
+        extra = {"torch_dtype": dtype} if dtype not in (None, "int8") else {}
+        with _MODEL_INIT_LOCK:
+            generator = pipeline("text-generation", model=path, device=device_idx, **extra)
+            if dtype == "int8":
+                # Квантуем один раз при загрузке; дальше модель берется из кэша
+                generator.model = _quantize_int8(generator.model)
+        return generator
+
+    def _shrink(self, keep: Optional[Tuple[str, int, str]]) -> None:
+        """Вытесняет LRU-модели, пока суммарный объем превышает бюджет."""
+        if self.max_memory_mb is None:
+            return
+        budget = self.max_memory_mb * 1024 * 1024
+        evicted = 0
+        for key in list(self._items):
+            if self.memory_bytes() <= budget:
+                break
+            if key != keep:
+                del self._items[key]
+                evicted += 1
+        if evicted:
+            self.evictions += evicted
+            gc.collect()
+
+    def memory_bytes(self) -> int:
+        """Суммарный объем весов моделей в кэше, в байтах."""
+        return sum(size for _, size in self._items.values())
+
+    def evict(self, model_id: Optional[str] = None, device_idx: Optional[int] = None,
+              dtype: Union[torch.dtype, str, None] = None) -> int:
+        """
+        Удаляет модели из кэша. Без аргументов очищает кэш полностью.
+
+        Параметры:
+            model_id (str|None): Удалить только эту модель (все устройства и типы).
+            device_idx (int|None): Дополнительный фильтр по устройству.
+            dtype (torch.dtype|str|None): Дополнительный фильтр по типу весов.
+
+        Возвращает:
+            int: Количество удаленных записей.
+        """
+        dtype_key = str(dtype) if dtype is not None else None
+        with self._lock:
+            removed = [
+                key for key in self._items
+                if (model_id is None or key[0] == model_id)
+                and (device_idx is None or key[1] == device_idx)
+                and (dtype_key is None or key[2] == dtype_key)
+            ]
+            for key in removed:
+                del self._items[key]
+            self.evictions += len(removed)
+        gc.collect()
+        if removed and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает счетчики попаданий/промахов и состояние кэша."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": [
+                    {"model": key[0], "device": key[1], "dtype": key[2], "memory_mb": round(size / 2**20, 1)}
+                    for key, (_, size) in self._items.items()
+                ],
+                "memory_mb": round(self.memory_bytes() / 2**20, 1),
+                "max_memory_mb": self.max_memory_mb,
+            }
+
+
+# Бюджет памяти кэша можно задать через переменную окружения (в мегабайтах)
+_cache_budget = os.environ.get("AI_TEXT_GENERATOR_CACHE_MB")
+_generator_cache = GeneratorCache(float(_cache_budget) if _cache_budget else None)
+
+
+def _default_device() -> int:
+    """Определяет устройство: GPU если доступно, иначе CPU."""
+    return 0 if torch.cuda.is_available() else -1
+
+
+def get_generator(model_id: str, device_idx: Optional[int] = None, dtype: Union[torch.dtype, str, None] = None):
+    """
+    Возвращает text-generation pipeline из процессного кэша.
+
+    Параметры:
+        model_id (str): Идентификатор модели в Hub.
+        device_idx (int|None): Индекс устройства; None — GPU если доступно, иначе CPU
+            (для "int8" всегда CPU).
+        dtype (torch.dtype|str|None): Тип весов модели или "int8".
+
+    Возвращает:
+        Pipeline: Загруженный pipeline.
+    """
+    if device_idx is None:
+        device_idx = -1 if dtype == "int8" else _default_device()
+    return _generator_cache.get(model_id, device_idx, dtype)
+
+
+def preload(model_id: str, device_idx: Optional[int] = None, dtype: Union[torch.dtype, str, None] = None) -> None:
+    """Заранее загружает модель в кэш, чтобы первый вызов run_model не платил за загрузку."""
+    get_generator(model_id, device_idx, dtype)
+
+
+def evict(model_id: Optional[str] = None, device_idx: Optional[int] = None,
+          dtype: Union[torch.dtype, str, None] = None) -> int:
+    """Выгружает модели из кэша (все, если model_id не указан). Возвращает число удаленных записей."""
+    return _generator_cache.evict(model_id, device_idx, dtype)
+
+
+def configure_cache(max_memory_mb: Optional[float]) -> None:
+    """Задает бюджет памяти кэша в мегабайтах (None — без ограничения) и применяет его сразу."""
+    with _generator_cache._lock:
+        _generator_cache.max_memory_mb = max_memory_mb
+        _generator_cache._shrink(keep=None)
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Возвращает статистику кэша моделей: hits, misses, evictions, занятую память."""
+    return _generator_cache.stats()
+
+
+class PrefixCache:
+    """
+    Ограниченный LRU-кэш past_key_values для зарегистрированных префиксов промптов.
+
+    Ключ — (model_id, режим точности, sha256 префикса). Если промпт начинается с зарегистрированного
+    префикса, модель кодирует только суффикс, а префикс берется из кэша.
+    Счетчик saved_prefill_tokens показывает, сколько токенов префикса не пришлось
+    прогонять через модель повторно.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_prefill_tokens = 0
+
+    @staticmethod
+    def _key(model_id: str, precision: Optional[str], prefix: str) -> Tuple[str, str, str]:
+        return (model_id, precision or DEFAULT_PRECISION, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+
+    def register(self, model_id: str, generator, prefix: str, precision: Optional[str] = None) -> int:
+        """
+        Прогоняет префикс через модель и сохраняет его past_key_values.
+
+        Параметры:
+            model_id (str): Идентификатор модели.
+            generator: Text-generation pipeline этой модели.
+            prefix (str): Текст префикса.
+            precision (str|None): Режим точности, в котором загружена модель.
+
+        Возвращает:
+            int: Количество токенов префикса.
+        """
+        tokenizer, model = generator.tokenizer, generator.model
+        encoded = tokenizer(prefix, return_tensors="pt").to(model.device)
+        with torch.no_grad():
+            out = model(input_ids=encoded["input_ids"], attention_mask=encoded["attention_mask"], use_cache=True)
+
+        key = self._key(model_id, precision, prefix)
+        with self._lock:
+            self._items[key] = {
+                "prefix": prefix,
+                "input_ids": encoded["input_ids"][0].tolist(),
+                "past_key_values": out.past_key_values,
+            }
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return len(encoded["input_ids"][0])
+
+    def lookup(self, model_id: str, generator, prompt: str, precision: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Ищет самый длинный зарегистрированный префикс промпта для модели.
+
+        Префикс подходит, только если токены промпта начинаются ровно с токенов префикса
+        (на стыке BPE может склеить токены иначе) и после него остается хотя бы один токен.
+        Попадание учитывается в статистике только после успешной генерации (см. record_hit).
+
+        Возвращает:
+            dict|None: Запись кэша ('prefix', 'input_ids', 'past_key_values') или None.
+        """
+        model_key = (model_id, precision or DEFAULT_PRECISION)
+        with self._lock:
+            if not any(key[:2] == model_key for key in self._items):
+                return None
+            candidates = [
+                (key, entry) for key, entry in self._items.items()
+                if key[:2] == model_key and prompt.startswith(entry["prefix"])
+            ]
+            candidates.sort(key=lambda item: len(item[1]["input_ids"]), reverse=True)
+
+            prompt_ids = generator.tokenizer(prompt)["input_ids"] if candidates else []
+            for key, entry in candidates:
+                n = len(entry["input_ids"])
+                if len(prompt_ids) > n and prompt_ids[:n] == entry["input_ids"]:
+                    self._items.move_to_end(key)
+                    return entry
+            self.misses += 1
+            return None
+
+    def record_hit(self, entry: Dict[str, Any]) -> None:
+        """Учитывает успешную генерацию с префиксом entry из lookup."""
+        with self._lock:
+            self.hits += 1
+            self.saved_prefill_tokens += len(entry["input_ids"])
+
+    def clear(self, model_id: Optional[str] = None) -> int:
+        """Удаляет префиксы модели (или все). Возвращает число удаленных записей."""
+        with self._lock:
+            removed = [key for key in self._items if model_id is None or key[0] == model_id]
+            for key in removed:
+                del self._items[key]
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает счетчики попаданий/промахов и число сэкономленных токенов prefill."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved_prefill_tokens": self.saved_prefill_tokens,
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+            }
+
+
+_prefix_cache = PrefixCache()
+
+
+def register_prefix(model_id: str, prefix: str, precision: Optional[str] = None) -> int:
+    """
+    Регистрирует общий префикс промптов (системная преамбула и т.п.) для модели.
+    Последующие вызовы run_model с промптами, начинающимися с него, переиспользуют его KV-кэш.
+
+    Параметры:
+        model_id (str): Идентификатор модели в Hub.
+        prefix (str): Текст префикса.
+        precision (str|None): Режим точности, с которым будет вызываться run_model.
+
+    Возвращает:
+        int: Количество токенов префикса.
+    """
+    _validate_model_id(model_id)
+    _validate_prompt(prefix)
+    generator = get_generator(model_id, dtype=_precision_dtype(precision))
+    return _prefix_cache.register(model_id, generator, prefix, precision)
+
+
+def clear_prefixes(model_id: Optional[str] = None) -> int:
+    """Удаляет зарегистрированные префиксы модели (или все). Возвращает число удаленных записей."""
+    return _prefix_cache.clear(model_id)
+
+
+def configure_prefix_cache(max_entries: int) -> None:
+    """Задает максимальное число префиксов в кэше; лишние (давно не использованные) удаляются."""
+    if not isinstance(max_entries, int) or max_entries < 1:
+        raise ValueError("max_entries должен быть положительным целым числом")
+    with _prefix_cache._lock:
+        _prefix_cache.max_entries = max_entries
+        while len(_prefix_cache._items) > max_entries:
+            _prefix_cache._items.popitem(last=False)
+
+
+def prefix_cache_stats() -> Dict[str, Any]:
+    """Возвращает статистику кэша префиксов, включая saved_prefill_tokens."""
+    return _prefix_cache.stats()
+
+
+# Параметры сэмплирования не влияют на результат при do_sample=False
+_SAMPLING_ONLY_PARAMS = ("temperature", "top_p", "top_k", "typical_p")
+
+
+def _is_deterministic(params: Dict[str, Any]) -> bool:
+    """Проверяет, что генерация с такими параметрами детерминирована (без сэмплирования)."""
+    return not params.get("do_sample", False)
+
+
+class ResultCache:
+    """
+    Персистентный кэш результатов детерминированной генерации в SQLite.
+
+    Ключ — sha256 от (model_id, ревизия модели, промпт, нормализованные параметры генерации).
+    Вместе с текстом хранятся итоговые параметры генерации, поэтому попадание не требует
+    загрузки модели.
+    При превышении max_size_mb удаляются записи, к которым давно не обращались.
+    """
+
+    def __init__(self, cache_dir: str, max_size_mb: float = 256):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "results.sqlite")
+        self.max_size_mb = max_size_mb
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, generated_text TEXT NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL, gen_kwargs TEXT)"
+        )
+        # Базы прежней версии: параметры генерации не сохранялись
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+        if "gen_kwargs" not in columns:
+            self._conn.execute("ALTER TABLE results ADD COLUMN gen_kwargs TEXT")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def make_key(model_id: str, revision: Optional[str], prompt: str, params: Dict[str, Any],
+                 precision: Optional[str] = None) -> str:
+        """Строит ключ кэша; параметры сэмплирования отбрасываются, ключи сортируются."""
+        normalized = {k: v for k, v in params.items() if k not in _SAMPLING_ONLY_PARAMS}
+        payload = json.dumps([model_id, revision, precision or DEFAULT_PRECISION, prompt, normalized],
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Возвращает (сохраненный текст, параметры генерации) или None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generated_text, gen_kwargs FROM results WHERE key = ? AND gen_kwargs IS NOT NULL", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0], json.loads(row[1])
+
+    def put(self, key: str, generated_text: str, params: Dict[str, Any]) -> None:
+        """Сохраняет текст с параметрами генерации и при необходимости вытесняет старые записи."""
+        gen_kwargs = json.dumps(params, sort_keys=True, default=str)
+        size = len(generated_text.encode("utf-8")) + len(gen_kwargs) + len(key)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, generated_text, size, accessed, gen_kwargs) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, generated_text, size, time.time(), gen_kwargs),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def record_bypass(self) -> None:
+        """Учитывает вызов, для которого кэш не используется (сэмплирование, черновая модель)."""
+        with self._lock:
+            self.bypassed += 1
+
+    def _evict(self) -> None:
+        """Удаляет давно не использованные записи, пока размер превышает лимит."""
+        budget = self.max_size_mb * 1024 * 1024
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= budget:
+            return
+        rows = self._conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= budget:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        """Очищает кэш."""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает счетчики и текущий размер кэша."""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "entries": entries,
+            "size_mb": round(total / 2**20, 3),
+            "max_size_mb": self.max_size_mb,
+        }
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def enable_result_cache(cache_dir: Optional[str] = None, max_size_mb: float = 256) -> None:
+    """
+    Включает персистентный кэш результатов для детерминированной генерации (do_sample=False).
+    При включенном сэмплировании кэш автоматически не используется.
+
+    Параметры:
+        cache_dir (str|None): Папка для базы SQLite; по умолчанию AI_TEXT_GENERATOR_CACHE_DIR
+            или ~/.cache/ai_text_generator.
+        max_size_mb (float): Максимальный размер сохраненных результатов в мегабайтах.
+    """
+    global _result_cache
+    if cache_dir is None:
+        cache_dir = os.environ.get("AI_TEXT_GENERATOR_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "ai_text_generator"))
+    disable_result_cache()
+    _result_cache = ResultCache(cache_dir, max_size_mb)
+
+
+def disable_result_cache() -> None:
+    """Выключает персистентный кэш результатов (файл базы сохраняется)."""
+    global _result_cache
+    if _result_cache is not None:
+        _result_cache.close()
+        _result_cache = None
+
+
+def result_cache_stats() -> Optional[Dict[str, Any]]:
+    """Возвращает статистику кэша результатов или None, если он выключен."""
+    return _result_cache.stats() if _result_cache is not None else None
+
+
+def _model_revision(generator) -> Optional[str]:
+    """Ревизия (commit hash) модели из Hub; для локальных моделей — None."""
+    return getattr(generator.model.config, "_commit_hash", None)
+
+
+_WEIGHT_FILE_SUFFIXES = (".safetensors", ".bin", ".json")
+
+
+def _model_fingerprint(model_id: str) -> Optional[str]:
+    """
+    Версия модели для ключа кэша результатов без загрузки модели.
+
+    Для локальной папки — имена, размеры и время изменения файлов весов и конфигурации
+    (ключ меняется при замене весов); для модели из Hub — commit hash из локального кэша
+    huggingface_hub (refs/main). None, если версию так определить нельзя.
+    """
+    if os.path.isdir(model_id):
+        files = []
+        for name in sorted(os.listdir(model_id)):
+            if name.endswith(_WEIGHT_FILE_SUFFIXES):
+                stat = os.stat(os.path.join(model_id, name))
+                files.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+        return "local:" + hashlib.sha256("|".join(files).encode("utf-8")).hexdigest()
+    try:
+        from huggingface_hub.constants import HF_HUB_CACHE
+    except ImportError:
+        return None
+    ref = os.path.join(HF_HUB_CACHE, "models--" + model_id.replace("/", "--"), "refs", "main")
+    try:
+        with open(ref, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _validate_model_id(model_id: str) -> None:
+    """Проверяет, что model_id — непустая строка."""
+    if not isinstance(model_id, str) or not model_id.strip():
+        raise ValueError("model_id должен быть непустой строкой")
+
+
+def _validate_prompt(prompt: str) -> None:
+    """Проверяет, что промпт — непустая строка."""
+    if not isinstance(prompt, str):
+        raise TypeError("prompt должен быть строкой")
+    if prompt.strip() == "":
+        raise ValueError("prompt не должен быть пустым или состоять только из пробелов")
+
+
+# Параметры генерации по умолчанию (кроме pad_token_id, который берется из токенизатора модели)
+_GENERATION_DEFAULTS: Dict[str, Any] = {
+    "max_new_tokens": 80,
+    "do_sample": False,
+    "temperature": 0.9,
+    "top_p": 0.95,
+    "repetition_penalty": 1.1,
+    "num_return_sequences": 1,
+}
+
+
+def _generation_params(generator, gen_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Собирает итоговые параметры генерации: значения по умолчанию, переопределенные gen_kwargs.
+
+    Параметры:
+        generator: Text-generation pipeline (нужен для pad_token_id по умолчанию).
+        gen_kwargs (dict): Параметры, переданные пользователем.
+
+    Возвращает:
+        dict: Параметры для генерации.
+    """
+    pad_id = getattr(generator.tokenizer, "pad_token_id", None) or generator.tokenizer.eos_token_id
+    defaults = dict(_GENERATION_DEFAULTS, pad_token_id=pad_id)
+    defaults.update(gen_kwargs)
+    return defaults
+
+
+def _build_result(model_id: str, prompt: str, text: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Формирует словарь результата генерации с подсчетом слов."""
+    total_words = word_count(text)
+    new_words = word_count(text[len(prompt):]) if text.startswith(prompt) else None
+    return {
+        "model": model_id,
+        "prompt": prompt,
+        "generated_text": text,
+        "total_words": total_words,
+        "new_words": new_words,
+        "gen_kwargs": params,
+    }
+
+
+def run_model(model_id: str, prompt: str, draft_model_id: Optional[str] = None, precision: Optional[str] = None,
+              **gen_kwargs) -> Dict[str, Any]:
     """
     Запускает генерацию текста с помощью Hugging Face pipeline и возвращает результат без вывода в консоль.
 
     Параметры:
         model_id (str): Идентификатор модели в Hub (например, 'gpt2').
         prompt (str): Промпт для генерации (не должен быть пустым или состоять только из пробелов).
+        draft_model_id (str|None): Черновая модель с тем же токенизатором (например, 'distilgpt2'
+            для 'gpt2') для спекулятивного декодирования. При do_sample=False текст совпадает
+            с генерацией без нее.
+        precision (str|None): Режим точности: 'fp32', 'bf16' или 'int8' (динамическая квантизация
+            Linear-слоев, только CPU). None — то же, что 'fp32'. Подготовленная модель кэшируется.
         **gen_kwargs: Произвольные параметры генерации, например:
             - max_new_tokens (int)
             - do_sample (bool)
@@ -41,55 +751,361 @@ def run_model(model_id: str, prompt: str, **gen_kwargs) -> Dict[str, Any]:
             - 'total_words' (int): Количество слов во всем тексте.
             - 'new_words' (int|None): Количество слов после промпта, если он является префиксом; иначе None.
             - 'gen_kwargs' (dict): Итоговые параметры генерации.
+            - 'prefix_tokens_reused' (int): Только если использован зарегистрированный префикс
+              (см. register_prefix) — сколько токенов префикса взято из KV-кэша.
+            - 'draft_model', 'draft_acceptance_rate', 'draft_tokens_proposed', 'draft_tokens_accepted':
+              Только при draft_model_id — статистика черновой модели.
     """
     # Валидация входных данных
-    if not isinstance(model_id, str) or not model_id.strip():
-        raise ValueError("model_id должен быть непустой строкой")
-    if not isinstance(prompt, str):
-        raise TypeError("prompt должен быть строкой")
-    if prompt.strip() == "":
-        raise ValueError("prompt не должен быть пустым или состоять только из пробелов")
+    _validate_model_id(model_id)
+    _validate_prompt(prompt)
+    if draft_model_id is not None:
+        _validate_model_id(draft_model_id)
+        if draft_model_id == model_id:
+            raise ValueError("draft_model_id должен отличаться от model_id")
 
-    # Определяем устройство: GPU если доступно, иначе CPU
-    device_idx = 0 if torch.cuda.is_available() else -1
+    # Детерминированный результат может быть уже сохранен в персистентном кэше.
+    # Ключ строится без загрузки модели: по версии весов и запрошенным параметрам
+    # (pad_token_id по умолчанию определяется самой моделью). Со спекулятивным
+    # декодированием кэш не используется: результат включает статистику черновой модели
+    cache_key = None
+    if _result_cache is not None:
+        requested = dict(_GENERATION_DEFAULTS, **gen_kwargs)
+        if _is_deterministic(requested) and draft_model_id is None:
+            revision = _model_fingerprint(model_id)
+            if revision is None:
+                revision = _model_revision(get_generator(model_id, dtype=_precision_dtype(precision)))
+            cache_key = ResultCache.make_key(model_id, revision, prompt, requested, precision)
+            cached = _result_cache.get(cache_key)
+            if cached is not None:
+                cached_text, cached_params = cached
+                return _build_result(model_id, prompt, cached_text, cached_params)
+        else:
+            _result_cache.record_bypass()
 
-    # Загружаем модель и токенизатор
-    generator = pipeline("text-generation", model=model_id, device=device_idx)
+    # Берем модель и токенизатор из кэша (загрузка только при первом обращении)
+    generator = get_generator(model_id, dtype=_precision_dtype(precision))
 
     # Фиксируем сид для воспроизводимости
     set_seed(42)
 
     # Значения по умолчанию, можно переопределить в gen_kwargs
-    pad_id = getattr(generator.tokenizer, "pad_token_id", None) or generator.tokenizer.eos_token_id
-    defaults: Dict[str, Any] = {
-        "max_new_tokens": 80,
-        "do_sample": False,
-        "temperature": 0.9,
-        "top_p": 0.95,
-        "repetition_penalty": 1.1,
-        "num_return_sequences": 1,
-        "pad_token_id": pad_id,
-    }
-    defaults.update(gen_kwargs)
+    params = _generation_params(generator, gen_kwargs)
+
+    if draft_model_id is not None:
+        result = _generate_with_draft(model_id, prompt, generator, draft_model_id, params, precision)
+    else:
+        result = _generate_single(model_id, prompt, generator, params, precision)
+    if cache_key is not None:
+        _result_cache.put(cache_key, result["generated_text"], params)
+    return result
+
+
+def _generate_with_draft(model_id: str, prompt: str, generator, draft_model_id: str,
+                         params: Dict[str, Any], precision: Optional[str] = None) -> Dict[str, Any]:
+    """Генерирует текст для одного промпта со спекулятивным декодированием черновой моделью."""
+    if params.get("num_return_sequences", 1) != 1:
+        raise ValueError("Спекулятивное декодирование поддерживает только num_return_sequences=1")
+    draft = get_generator(draft_model_id, dtype=_precision_dtype(precision))
+    if len(draft.tokenizer) != len(generator.tokenizer) or draft.tokenizer.eos_token_id != generator.tokenizer.eos_token_id:
+        raise ValueError(f"Токенизаторы моделей '{model_id}' и '{draft_model_id}' не совпадают")
+
+    text, stats = _generate_assisted(generator, draft, prompt, params)
+    result = _build_result(model_id, prompt, text, params)
+    result["draft_model"] = draft_model_id
+    result.update(stats)
+    return result
+
+
+def _generate_single(model_id: str, prompt: str, generator, params: Dict[str, Any],
+                     precision: Optional[str] = None) -> Dict[str, Any]:
+    """Генерирует текст для одного промпта, переиспользуя KV-кэш префикса, если он зарегистрирован."""
+    # Если промпт начинается с зарегистрированного префикса, кодируем только суффикс.
+    # Кэш префикса рассчитан на одну последовательность: с beam search или несколькими
+    # последовательностями generate размножает вход, и кэш с batch=1 не подходит
+    entry = None
+    if params.get("num_beams", 1) <= 1 and params.get("num_return_sequences", 1) <= 1:
+        entry = _prefix_cache.lookup(model_id, generator, prompt, precision)
+    if entry is not None:
+        # generate дописывает в переданный кэш, поэтому работаем с копией
+        past = copy.deepcopy(entry["past_key_values"])
+        text = _generate_batch(generator, [prompt], params, past_key_values=past)[0]
+        _prefix_cache.record_hit(entry)
+        result = _build_result(model_id, prompt, text, params)
+        result["prefix_tokens_reused"] = len(entry["input_ids"])
+        return result
 
     # Генерируем текст
-    out = generator(prompt, **defaults)
+    out = generator(prompt, **params)
     text = out[0]["generated_text"]
 
-    # Считаем слова
-    total_words = word_count(text)
-    new_words = word_count(text[len(prompt):]) if text.startswith(prompt) else None
-
     # Возвращаем результат вместо печати
-    return {
-        "model": model_id,
-        "prompt": prompt,
-        "generated_text": text,
-        "total_words": total_words,
-        "new_words": new_words,
-        "gen_kwargs": defaults,
+    return _build_result(model_id, prompt, text, params)
+
+
+def _generate_batch(generator, prompts: List[str], params: Dict[str, Any], **generate_extra) -> List[str]:
+    """
+    Генерирует продолжения для пакета промптов одним вызовом model.generate.
+
+    Промпты дополняются слева до длины самого длинного в пакете (для decoder-only моделей
+    новые токены должны идти сразу после промпта). Декодирование повторяет логику
+    text-generation pipeline, поэтому текст совпадает с результатом run_model.
+
+    Параметры:
+        generator: Text-generation pipeline с моделью и токенизатором.
+        prompts (list[str]): Промпты одного пакета.
+        params (dict): Параметры генерации.
+        **generate_extra: Дополнительные аргументы model.generate (например, past_key_values).
+
+    Возвращает:
+        list[str]: Полные тексты (промпт + продолжение) в порядке prompts.
+    """
+    tokenizer, model = generator.tokenizer, generator.model
+    pad_id = params.get("pad_token_id")
+    if pad_id is None:
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    # Дополняем слева вручную: токенизатор общий для потоков (кэш моделей), поэтому
+    # его pad_token и padding_side не меняем
+    prompt_ids = tokenizer(prompts)["input_ids"]
+    width = max(len(ids) for ids in prompt_ids)
+    input_ids = torch.tensor([[pad_id] * (width - len(ids)) + ids for ids in prompt_ids], device=model.device)
+    attention_mask = torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in prompt_ids],
+                                  device=model.device)
+
+    with torch.no_grad():
+        output_ids = model.generate(input_ids=input_ids, attention_mask=attention_mask,
+                                    **dict(params, pad_token_id=pad_id), **generate_extra)
+
+    num_return = params.get("num_return_sequences", 1)
+    # Берем первую последовательность для каждого промпта, как run_model
+    return [
+        _decode_continuation(tokenizer, prompt, input_ids[i], output_ids[i * num_return])
+        for i, prompt in enumerate(prompts)
+    ]
+
+
+def _decode_continuation(tokenizer, prompt: str, input_ids, output_ids) -> str:
+    """
+    Декодирует результат generate так же, как text-generation pipeline:
+    исходный промпт + текст после декодированного промпта.
+    """
+    full = tokenizer.decode(output_ids, skip_special_tokens=True, clean_up_tokenization_spaces=True)
+    prompt_len = len(tokenizer.decode(input_ids, skip_special_tokens=True, clean_up_tokenization_spaces=True))
+    return prompt + full[prompt_len:]
+
+
+def _count_forward_calls(model) -> Tuple[List[int], Any]:
+    """Вешает forward-hook, считающий вызовы модели. Возвращает счетчик и handle для снятия хука."""
+    counter = [0]
+
+    def hook(module, inputs, output):
+        counter[0] += 1
+
+    return counter, model.register_forward_hook(hook)
+
+
+def _generate_assisted(generator, draft, prompt: str, params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Спекулятивная (assisted) генерация: черновая модель предлагает токены,
+    основная проверяет их одним проходом. При do_sample=False результат совпадает
+    с обычной жадной генерацией основной модели.
+
+    Доля принятых токенов оценивается по числу вызовов моделей: каждый проход основной
+    модели дает ровно один «собственный» токен, остальные новые токены — принятые
+    предложения черновой модели; каждый вызов черновой модели — одно предложение.
+
+    Параметры:
+        generator: Pipeline основной модели.
+        draft: Pipeline черновой модели (с тем же токенизатором).
+        prompt (str): Промпт.
+        params (dict): Параметры генерации.
+
+    Возвращает:
+        tuple: (полный текст, статистика черновой модели).
+    """
+    tokenizer, model = generator.tokenizer, generator.model
+    encoded = tokenizer(prompt, return_tensors="pt").to(model.device)
+
+    target_calls, target_hook = _count_forward_calls(model)
+    draft_calls, draft_hook = _count_forward_calls(draft.model)
+    try:
+        with torch.no_grad():
+            output_ids = model.generate(input_ids=encoded["input_ids"], attention_mask=encoded["attention_mask"],
+                                        assistant_model=draft.model, **params)
+    finally:
+        target_hook.remove()
+        draft_hook.remove()
+
+    new_tokens = output_ids.shape[1] - encoded["input_ids"].shape[1]
+    proposed = draft_calls[0]
+    accepted = min(max(new_tokens - target_calls[0], 0), proposed)
+    stats = {
+        "draft_tokens_proposed": proposed,
+        "draft_tokens_accepted": accepted,
+        "draft_acceptance_rate": round(accepted / proposed, 4) if proposed else None,
     }
+    return _decode_continuation(tokenizer, prompt, encoded["input_ids"][0], output_ids[0]), stats
+
+
+def run_many(model_id: str, prompts: List[str], batch_size: int = 8, precision: Optional[str] = None,
+             **gen_kwargs) -> List[Dict[str, Any]]:
+    """
+    Пакетная генерация для списка промптов.
+
+    Промпты сортируются по длине в токенах и группируются в пакеты по batch_size,
+    поэтому внутри пакета дополнение паддингом минимально. Результаты возвращаются
+    в исходном порядке промптов.
+
+    Параметры:
+        model_id (str): Идентификатор модели в Hub.
+        prompts (list[str]): Список промптов (каждый непустой).
+        batch_size (int): Максимальный размер пакета.
+        precision (str|None): Режим точности, как в run_model.
+        **gen_kwargs: Параметры генерации, как в run_model. Учтите, что max_length
+            отсчитывается от длины пакета с паддингом.
+
+    Возвращает:
+        list[dict]: Для каждого промпта словарь того же формата, что возвращает run_model.
+    """
+    _validate_model_id(model_id)
+    if not isinstance(prompts, (list, tuple)):
+        raise TypeError("prompts должен быть списком строк")
+    for prompt in prompts:
+        _validate_prompt(prompt)
+    if not isinstance(batch_size, int) or batch_size < 1:
+        raise ValueError("batch_size должен быть положительным целым числом")
+    if not prompts:
+        return []
+
+    generator = get_generator(model_id, dtype=_precision_dtype(precision))
+    set_seed(42)
+    params = _generation_params(generator, gen_kwargs)
+
+    # Сортируем по длине в токенах, чтобы в пакеты попадали промпты близкой длины
+    lengths = [len(ids) for ids in generator.tokenizer(list(prompts))["input_ids"]]
+    order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(prompts)
+    for start in range(0, len(order), batch_size):
+        batch_idx = order[start:start + batch_size]
+        texts = _generate_batch(generator, [prompts[i] for i in batch_idx], params)
+        for i, text in zip(batch_idx, texts):
+            results[i] = _build_result(model_id, prompts[i], text, params)
+    return results
+
+
+class _TimedStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer, который дополнительно считает новые токены и время первого токена."""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.num_tokens = 0
+        self.first_token_time: Optional[float] = None
+
+    def put(self, value):
+        # Первый вызов put получает промпт — его не считаем
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter()
+            self.num_tokens += value.numel()
+        super().put(value)
+
+
+class GenerationStream:
+    """
+    Потоковый результат генерации: итерация выдает фрагменты текста по мере появления токенов.
+
+    Генерация выполняется в фоновом потоке. После окончания итерации итоговый словарь
+    доступен в атрибуте summary: те же ключи, что у run_model, плюс
+    'new_tokens', 'time_to_first_token' (сек), 'tokens_per_sec' и 'elapsed' (сек).
+    """
+
+    def __init__(self, model_id: str, prompt: str, generator, params: Dict[str, Any]):
+        self.model_id = model_id
+        self.prompt = prompt
+        self.params = params
+        self.summary: Optional[Dict[str, Any]] = None
+        self._chunks: List[str] = []
+        self._error: Optional[BaseException] = None
+
+        tokenizer, model = generator.tokenizer, generator.model
+        self._streamer = _TimedStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                        clean_up_tokenization_spaces=True)
+        encoded = tokenizer(prompt, return_tensors="pt").to(model.device)
+        generate_kwargs = dict(params, input_ids=encoded["input_ids"],
+                               attention_mask=encoded["attention_mask"], streamer=self._streamer)
+
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._generate, args=(model, generate_kwargs), daemon=True)
+        self._thread.start()
+
+    def _generate(self, model, generate_kwargs: Dict[str, Any]) -> None:
+        try:
+            with torch.no_grad():
+                model.generate(**generate_kwargs)
+        except BaseException as e:
+            self._error = e
+            # Завершаем стример, иначе итерация зависнет в ожидании токенов
+            self._streamer.end()
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self._streamer:
+            if chunk:
+                self._chunks.append(chunk)
+                yield chunk
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        self._finish()
+
+    def _finish(self) -> None:
+        """Собирает итоговый словарь с подсчетом слов и метриками скорости."""
+        end = time.perf_counter()
+        elapsed = end - self._start
+        first = self._streamer.first_token_time
+        new_tokens = self._streamer.num_tokens
+        text = self.prompt + "".join(self._chunks)
+
+        self.summary = _build_result(self.model_id, self.prompt, text, self.params)
+        self.summary.update({
+            "new_tokens": new_tokens,
+            "time_to_first_token": round(first - self._start, 4) if first is not None else None,
+            "tokens_per_sec": round(new_tokens / elapsed, 2) if elapsed > 0 else None,
+            "elapsed": round(elapsed, 4),
+        })
+
+
+def stream_model(model_id: str, prompt: str, precision: Optional[str] = None, **gen_kwargs) -> GenerationStream:
+    """
+    Потоковый вариант run_model: возвращает объект, итерация по которому выдает
+    декодированные фрагменты текста сразу по мере генерации токенов.
+
+    Пример:
+        stream = stream_model("gpt2", "In a village of La Mancha", max_new_tokens=60)
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        print(stream.summary["tokens_per_sec"])
+
+    Параметры:
+        model_id (str): Идентификатор модели в Hub.
+        prompt (str): Промпт для генерации.
+        precision (str|None): Режим точности, как в run_model.
+        **gen_kwargs: Параметры генерации, как в run_model (num_return_sequences должен быть 1).
+
+    Возвращает:
+        GenerationStream: Поток фрагментов текста; итоговый словарь в атрибуте summary.
+    """
+    _validate_model_id(model_id)
+    _validate_prompt(prompt)
+
+    generator = get_generator(model_id, dtype=_precision_dtype(precision))
+    set_seed(42)
+    params = _generation_params(generator, gen_kwargs)
+    if params.get("num_return_sequences", 1) != 1:
+        raise ValueError("Потоковая генерация поддерживает только num_return_sequences=1")
 
+    return GenerationStream(model_id, prompt, generator, params)
 
 if __name__ == "__main__":
     # Пример использования: генерация текста с разными моделями и параметрами
@@ -0,0 +1,523 @@
+"""
+Бенчмарки генерации текста для модуля ai_text_generator.
+
+Подкоманды:
+    speculative — сравнение задержки run_model с черновой моделью (draft_model_id) и без нее.
+    precision   — сравнение режимов точности (fp32/bf16/int8): токены/с, пиковый RSS,
+                  расхождение вывода с fp32.
+    sweep       — перебор моделей, длины промпта, max_new_tokens и размера пакета: время загрузки,
+                  время до первого токена, токены/с, задержки p50/p95, пиковая память; JSON/CSV.
+
+Пример:
+    python benchmark.py speculative --model gpt2 --draft distilgpt2 --max-new-tokens 60 --json spec.json
+    python benchmark.py precision --model gpt2 --model distilgpt2 --json precision.json
+    python benchmark.py sweep --tiny --prompt-tokens 8 64 --batch-size 1 4 --json sweep.json --csv sweep.csv
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ai_text_generator import (DEFAULT_PRECISION, PRECISIONS, _precision_dtype, get_generator, preload, run_many, run_model,
+                               stream_model)
+
+DEFAULT_PROMPTS = [
+    "In a village of La Mancha",
+    "Story about Mars",
+    "Science fiction story: The spacecraft commander looked at Mars through the viewport.",
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0..100) с линейной интерполяцией."""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def _latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """Сводка по задержкам в секундах."""
+    return {
+        "mean": round(statistics.fmean(latencies), 4),
+        "p50": round(_percentile(latencies, 50), 4),
+        "p95": round(_percentile(latencies, 95), 4),
+    }
+
+
+def _timed(fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, float]:
+    """Вызывает fn и возвращает (результат, время в секундах)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS текущего процесса в мегабайтах (None, если модуль resource недоступен)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux — в килобайтах
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _precision_worker(model_id: str, precision: str, prompts: List[str], max_new_tokens: int, conn) -> None:
+    """
+    Замер одного режима точности в отдельном процессе, чтобы пиковый RSS не смешивался
+    с другими режимами. Результат отправляется в conn.
+    """
+    try:
+        load_start = time.perf_counter()
+        generator = get_generator(model_id, dtype=_precision_dtype(precision))
+        load_time = time.perf_counter() - load_start
+
+        params = {"do_sample": False, "max_new_tokens": max_new_tokens}
+        run_model(model_id, prompts[0], precision=precision, **params)
+
+        continuations, new_tokens, elapsed = [], 0, 0.0
+        for prompt in prompts:
+            stream = stream_model(model_id, prompt, precision=precision, **params)
+            for _ in stream:
+                pass
+            new_tokens += stream.summary["new_tokens"]
+            elapsed += stream.summary["elapsed"]
+            continuation = stream.summary["generated_text"][len(prompt):]
+            continuations.append(generator.tokenizer(continuation)["input_ids"])
+
+        conn.send({
+            "precision": precision,
+            "load_time": round(load_time, 3),
+            "tokens_per_sec": round(new_tokens / elapsed, 2) if elapsed > 0 else None,
+            "peak_rss_mb": _peak_rss_mb(),
+            "continuations": continuations,
+        })
+    except Exception as e:
+        conn.send({"precision": precision, "error": str(e)})
+    finally:
+        conn.close()
+
+
+def _receive(conn, process, error_row):
+    """
+    Получает результат рабочего процесса и дожидается его завершения. Если процесс
+    завершился, ничего не отправив (например, убит по нехватке памяти), возвращает
+    error_row (dict или список из одного dict) с описанием ошибки.
+    """
+    try:
+        result = conn.recv()
+    except EOFError:
+        process.join()
+        message = f"рабочий процесс завершился без результата (код {process.exitcode})"
+        rows = error_row if isinstance(error_row, list) else [error_row]
+        for row in rows:
+            row["error"] = message
+        return error_row
+    process.join()
+    return result
+
+
+def _agreement(reference: List[int], candidate: List[int]) -> float:
+    """Доля токенов эталона, совпадающих с кандидатом до первого расхождения."""
+    if not reference:
+        return 1.0 if not candidate else 0.0
+    matched = 0
+    for ref_token, token in zip(reference, candidate):
+        if ref_token != token:
+            break
+        matched += 1
+    return matched / len(reference)
+
+
+def benchmark_precision(model_id: str, prompts: List[str], precisions: List[str],
+                        max_new_tokens: int = 60) -> List[Dict[str, Any]]:
+    """
+    Сравнивает режимы точности одной модели на жадной генерации.
+
+    Каждый режим запускается в отдельном процессе: это дает честный пиковый RSS
+    и исключает влияние кэша моделей. Расхождение считается относительно fp32
+    по токенам продолжения: exact_match — доля промптов с полностью совпавшим
+    выводом, agreement — средняя доля совпавших токенов до первого расхождения.
+
+    Параметры:
+        model_id (str): Модель.
+        prompts (list[str]): Промпты.
+        precisions (list[str]): Режимы точности; fp32 добавляется как эталон.
+        max_new_tokens (int): Число генерируемых токенов.
+
+    Возвращает:
+        list[dict]: Строки отчета по режимам.
+    """
+    if "fp32" not in precisions:
+        precisions = ["fp32"] + list(precisions)
+    ctx = multiprocessing.get_context("spawn")
+
+    measurements = {}
+    for precision in precisions:
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_precision_worker,
+                              args=(model_id, precision, prompts, max_new_tokens, child_conn))
+        process.start()
+        child_conn.close()
+        measurements[precision] = _receive(parent_conn, process, {"precision": precision})
+
+    reference = measurements["fp32"].get("continuations")
+    rows = []
+    for precision in precisions:
+        row = dict(measurements[precision], model=model_id)
+        continuations = row.pop("continuations", None)
+        if reference is not None and continuations is not None:
+            row["exact_match"] = round(statistics.fmean(
+                float(ref == cand) for ref, cand in zip(reference, continuations)), 3)
+            row["agreement"] = round(statistics.fmean(
+                _agreement(ref, cand) for ref, cand in zip(reference, continuations)), 3)
+        rows.append(row)
+    return rows
+
+
+def print_precision_report(rows: List[Dict[str, Any]]) -> None:
+    """Печатает сравнение режимов точности в виде таблицы."""
+    print(f"\n{'model':<20}{'precision':<11}{'load, с':>9}{'tok/s':>10}{'peak RSS, MB':>14}"
+          f"{'exact':>8}{'agree':>8}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['model']:<20}{row['precision']:<11}ошибка: {row['error']}")
+            continue
+        values = [str(row.get(key, "-")) for key in ("load_time", "tokens_per_sec", "peak_rss_mb",
+                                                      "exact_match", "agreement")]
+        print(f"{row['model']:<20}{row['precision']:<11}{values[0]:>9}{values[1]:>10}"
+              f"{values[2]:>14}{values[3]:>8}{values[4]:>8}")
+
+
+def make_tiny_models(target_dir: str, layers: Tuple[int, ...] = (2, 4)) -> List[str]:
+    """
+    Создает крошечные GPT-2 со случайными весами и локально обученным BPE-токенизатором.
+    Нужны для бенчмарков в CI без доступа к Hub.
+
+    Параметры:
+        target_dir (str): Папка, в которой будут созданы модели.
+        layers (tuple[int]): Число слоев для каждой модели.
+
+    Возвращает:
+        list[str]: Пути к моделям (подходят как model_id для run_model).
+    """
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    torch.manual_seed(0)
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=512, special_tokens=["<|endoftext|>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(DEFAULT_PROMPTS * 10, trainer)
+    fast_tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<|endoftext|>",
+                                             eos_token="<|endoftext|>", unk_token="<|endoftext|>")
+
+    paths = []
+    for n_layer in layers:
+        config = GPT2Config(vocab_size=len(fast_tokenizer), n_positions=1024, n_embd=64, n_layer=n_layer,
+                            n_head=4, bos_token_id=fast_tokenizer.eos_token_id,
+                            eos_token_id=fast_tokenizer.eos_token_id)
+        path = os.path.join(target_dir, f"tiny-gpt2-{n_layer}l")
+        GPT2LMHeadModel(config).save_pretrained(path)
+        fast_tokenizer.save_pretrained(path)
+        paths.append(path)
+    return paths
+
+
+def _make_prompt(tokenizer, num_tokens: int) -> str:
+    """Строит промпт примерно из num_tokens токенов, повторяя стандартные промпты."""
+    text = " ".join(DEFAULT_PROMPTS)
+    ids = tokenizer(text)["input_ids"]
+    while len(ids) < num_tokens:
+        text = f"{text} {text}"
+        ids = tokenizer(text)["input_ids"]
+    return tokenizer.decode(ids[:num_tokens], skip_special_tokens=True)
+
+
+def _sweep_worker(model_id: str, prompt_tokens: List[int], max_new_tokens: List[int], batch_sizes: List[int],
+                  repeats: int, precision: Optional[str], conn) -> None:
+    """
+    Прогон сетки для одной модели в отдельном процессе: время загрузки честное
+    (без кэша), пиковый RSS относится только к этой модели.
+    """
+    try:
+        load_start = time.perf_counter()
+        generator = get_generator(model_id, dtype=_precision_dtype(precision))
+        load_time = time.perf_counter() - load_start
+        tokenizer = generator.tokenizer
+        max_positions = getattr(generator.model.config, "n_positions",
+                                getattr(generator.model.config, "max_position_embeddings", None))
+
+        # Прогрев, чтобы первая точка не включала ленивую инициализацию
+        run_many(model_id, [DEFAULT_PROMPTS[0]], precision=precision, max_new_tokens=2)
+
+        rows = []
+        for n_prompt in prompt_tokens:
+            prompt = _make_prompt(tokenizer, n_prompt)
+            actual_tokens = len(tokenizer(prompt)["input_ids"])
+            for n_new in max_new_tokens:
+                for batch_size in batch_sizes:
+                    row = {"model": model_id, "precision": precision or DEFAULT_PRECISION, "prompt_tokens": actual_tokens,
+                           "max_new_tokens": n_new, "batch_size": batch_size, "load_time": round(load_time, 3)}
+                    if max_positions is not None and actual_tokens + n_new > max_positions:
+                        rows.append(dict(row, skipped=f"длина превышает {max_positions} позиций"))
+                        continue
+
+                    prompts = [prompt] * batch_size
+                    # Время до первого токена: prefill пакета и генерация одного токена
+                    _, ttft = _timed(run_many, model_id, prompts, batch_size=batch_size, precision=precision,
+                                     do_sample=False, max_new_tokens=1)
+                    # min_new_tokens фиксирует длину вывода, чтобы точки были сравнимы
+                    latencies = [
+                        _timed(run_many, model_id, prompts, batch_size=batch_size, precision=precision,
+                               do_sample=False, max_new_tokens=n_new, min_new_tokens=n_new)[1]
+                        for _ in range(repeats)
+                    ]
+                    stats = _latency_stats(latencies)
+                    row.update({
+                        "time_to_first_token": round(ttft, 4),
+                        "tokens_per_sec": round(batch_size * n_new / stats["mean"], 2),
+                        "latency_p50": stats["p50"],
+                        "latency_p95": stats["p95"],
+                        "peak_rss_mb": _peak_rss_mb(),
+                    })
+                    rows.append(row)
+        conn.send(rows)
+    except Exception as e:
+        conn.send([{"model": model_id, "precision": precision or DEFAULT_PRECISION, "error": str(e)}])
+    finally:
+        conn.close()
+
+
+def benchmark_sweep(model_ids: List[str], prompt_tokens: List[int], max_new_tokens: List[int],
+                    batch_sizes: List[int], repeats: int = 3, precision: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Перебирает сетку (модель × длина промпта × max_new_tokens × размер пакета).
+
+    Для каждой точки записываются время загрузки модели, время до первого токена,
+    токены/с, задержки p50/p95 и пиковый RSS процесса. Каждая модель измеряется
+    в отдельном процессе.
+
+    Параметры:
+        model_ids (list[str]): Модели (id в Hub или локальные пути).
+        prompt_tokens (list[int]): Длины промптов в токенах.
+        max_new_tokens (list[int]): Число генерируемых токенов.
+        batch_sizes (list[int]): Размеры пакетов для run_many.
+        repeats (int): Повторов на точку.
+        precision (str|None): Режим точности, как в run_model.
+
+    Возвращает:
+        dict: {'meta': окружение и параметры запуска, 'results': строки по точкам сетки}.
+    """
+    import torch
+    import transformers
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for model_id in model_ids:
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_sweep_worker, args=(model_id, prompt_tokens, max_new_tokens, batch_sizes,
+                                                          repeats, precision, child_conn))
+        process.start()
+        child_conn.close()
+        results.extend(_receive(parent_conn, process,
+                                [{"model": model_id, "precision": precision or DEFAULT_PRECISION}]))
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+SWEEP_COLUMNS = ["model", "precision", "prompt_tokens", "max_new_tokens", "batch_size", "load_time",
+                 "time_to_first_token", "tokens_per_sec", "latency_p50", "latency_p95", "peak_rss_mb",
+                 "skipped", "error"]
+
+
+def print_sweep_report(report: Dict[str, Any]) -> None:
+    """Печатает результаты перебора в виде таблицы."""
+    header = ["prompt", "new", "batch", "load, с", "ttft, с", "tok/s", "p50, с", "p95, с", "RSS, MB"]
+    keys = ["prompt_tokens", "max_new_tokens", "batch_size", "load_time", "time_to_first_token",
+            "tokens_per_sec", "latency_p50", "latency_p95", "peak_rss_mb"]
+    model_id = None
+    for row in report["results"]:
+        if row["model"] != model_id:
+            model_id = row["model"]
+            print(f"\nmodel = {model_id} | precision = {row['precision']}")
+            print("".join(f"{name:>10}" for name in header))
+        if "error" in row or "skipped" in row:
+            print(f"  {row.get('error') or row.get('skipped')}")
+            continue
+        print("".join(f"{str(row[key]):>10}" for key in keys))
+
+
+def save_sweep_csv(report: Dict[str, Any], path: str) -> None:
+    """Сохраняет строки перебора в CSV."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SWEEP_COLUMNS)
+        writer.writeheader()
+        for row in report["results"]:
+            writer.writerow({key: row.get(key) for key in SWEEP_COLUMNS})
+
+
+def benchmark_speculative(model_id: str, draft_model_id: str, prompts: List[str],
+                          max_new_tokens: int = 60, repeats: int = 3) -> Dict[str, Any]:
+    """
+    Сравнивает жадную генерацию основной модели с ее спекулятивным вариантом.
+
+    Обе модели загружаются заранее, перед замерами выполняется прогревочный вызов,
+    поэтому в задержку входит только сама генерация.
+
+    Параметры:
+        model_id (str): Основная модель.
+        draft_model_id (str): Черновая модель.
+        prompts (list[str]): Промпты для замеров.
+        max_new_tokens (int): Число генерируемых токенов.
+        repeats (int): Сколько раз повторять каждый промпт.
+
+    Возвращает:
+        dict: Задержки обоих режимов, ускорение, средняя доля принятых токенов
+        и признак совпадения текстов.
+    """
+    preload(model_id)
+    preload(draft_model_id)
+    params = {"do_sample": False, "max_new_tokens": max_new_tokens}
+    run_model(model_id, prompts[0], **params)
+    run_model(model_id, prompts[0], draft_model_id=draft_model_id, **params)
+
+    baseline, speculative, acceptance = [], [], []
+    outputs_match = True
+    for prompt in prompts:
+        for _ in range(repeats):
+            base_result, base_time = _timed(run_model, model_id, prompt, **params)
+            spec_result, spec_time = _timed(run_model, model_id, prompt, draft_model_id=draft_model_id, **params)
+            baseline.append(base_time)
+            speculative.append(spec_time)
+            if spec_result["draft_acceptance_rate"] is not None:
+                acceptance.append(spec_result["draft_acceptance_rate"])
+            outputs_match = outputs_match and base_result["generated_text"] == spec_result["generated_text"]
+
+    base_stats = _latency_stats(baseline)
+    spec_stats = _latency_stats(speculative)
+    return {
+        "model": model_id,
+        "draft_model": draft_model_id,
+        "max_new_tokens": max_new_tokens,
+        "runs": len(baseline),
+        "baseline": base_stats,
+        "speculative": spec_stats,
+        "speedup": round(base_stats["mean"] / spec_stats["mean"], 3),
+        "mean_acceptance_rate": round(statistics.fmean(acceptance), 4) if acceptance else None,
+        "outputs_match": outputs_match,
+    }
+
+
+def print_speculative_report(report: Dict[str, Any]) -> None:
+    """Печатает сравнение задержек в виде таблицы."""
+    print(f"\nmodel = {report['model']} | draft = {report['draft_model']} | "
+          f"max_new_tokens = {report['max_new_tokens']} | запусков: {report['runs']}")
+    print(f"{'режим':<14}{'mean, с':>10}{'p50, с':>10}{'p95, с':>10}")
+    for mode in ("baseline", "speculative"):
+        stats = report[mode]
+        print(f"{mode:<14}{stats['mean']:>10}{stats['p50']:>10}{stats['p95']:>10}")
+    print(f"Ускорение: x{report['speedup']} | Доля принятых токенов: {report['mean_acceptance_rate']} | "
+          f"Тексты совпадают: {report['outputs_match']}")
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Парсер аргументов командной строки с подкомандами бенчмарков."""
+    parser = argparse.ArgumentParser(description="Бенчмарки генерации текста")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    spec = subparsers.add_parser("speculative", help="Задержка с черновой моделью и без нее")
+    spec.add_argument("--model", default="gpt2", help="Основная модель")
+    spec.add_argument("--draft", default="distilgpt2", help="Черновая модель")
+    spec.add_argument("--prompt", action="append", help="Промпт (можно указать несколько раз)")
+    spec.add_argument("--max-new-tokens", type=int, default=60)
+    spec.add_argument("--repeats", type=int, default=3)
+    spec.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    prec = subparsers.add_parser("precision", help="Сравнение режимов точности с fp32")
+    prec.add_argument("--model", action="append", help="Модель (можно указать несколько раз)")
+    prec.add_argument("--precision", action="append", choices=list(PRECISIONS),
+                      help="Режим точности (по умолчанию все)")
+    prec.add_argument("--prompt", action="append", help="Промпт (можно указать несколько раз)")
+    prec.add_argument("--max-new-tokens", type=int, default=60)
+    prec.add_argument("--json", help="Путь для сохранения результатов в JSON")
+
+    sweep = subparsers.add_parser("sweep", help="Перебор моделей, длины промпта, max_new_tokens и пакета")
+    sweep.add_argument("--model", action="append", help="Модель (можно указать несколько раз)")
+    sweep.add_argument("--tiny", action="store_true",
+                       help="Использовать крошечные случайные локальные модели (без доступа к Hub)")
+    sweep.add_argument("--prompt-tokens", type=int, nargs="+", default=[16, 128])
+    sweep.add_argument("--max-new-tokens", type=int, nargs="+", default=[32])
+    sweep.add_argument("--batch-size", type=int, nargs="+", default=[1, 4])
+    sweep.add_argument("--repeats", type=int, default=3)
+    sweep.add_argument("--precision", choices=list(PRECISIONS))
+    sweep.add_argument("--json", help="Путь для сохранения результатов в JSON")
+    sweep.add_argument("--csv", help="Путь для сохранения результатов в CSV")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+
+    if args.command == "speculative":
+        report = benchmark_speculative(args.model, args.draft, args.prompt or DEFAULT_PROMPTS,
+                                       max_new_tokens=args.max_new_tokens, repeats=args.repeats)
+        print_speculative_report(report)
+    elif args.command == "precision":
+        report = []
+        for model_id in args.model or ["gpt2", "distilgpt2"]:
+            report.extend(benchmark_precision(model_id, args.prompt or DEFAULT_PROMPTS,
+                                              args.precision or list(PRECISIONS), args.max_new_tokens))
+        print_precision_report(report)
+    elif args.command == "sweep":
+        with tempfile.TemporaryDirectory() as tiny_dir:
+            model_ids = list(args.model or [])
+            if args.tiny:
+                # Дочерние процессы наследуют окружение и не обращаются к Hub
+                os.environ["HF_HUB_OFFLINE"] = "1"
+                model_ids.extend(make_tiny_models(tiny_dir))
+            report = benchmark_sweep(model_ids or ["gpt2", "distilgpt2"], args.prompt_tokens, args.max_new_tokens,
+                                     args.batch_size, args.repeats, args.precision)
+            # Временные пути крошечных моделей меняются от запуска к запуску, оставляем только имя
+            for row in report["results"]:
+                if row["model"].startswith(tiny_dir):
+                    row["model"] = os.path.basename(row["model"])
+        print_sweep_report(report)
+        if args.csv:
+            save_sweep_csv(report, args.csv)
+            print(f"Результаты сохранены в: {args.csv}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Локальный asyncio-сервер генерации текста с микробатчингом поверх ai_text_generator.
+
+Сервер держит одну загруженную модель на model_id (через кэш ai_text_generator)
+и объединяет одновременные запросы в пакеты для run_many. Пакет отправляется,
+когда набрано max_batch_size запросов или с момента первого прошло max_wait_ms.
+Очередь каждой модели ограничена: при переполнении сервер сразу отвечает 503.
+Запрос, не уложившийся в таймаут, получает 504.
+
+HTTP API (JSON):
+    POST /generate  {"model_id": "gpt2", "prompt": "...", "gen_kwargs": {...}, "timeout": 30}
+    GET  /metrics   глубина очередей, размеры пакетов, задержки p50/p95
+    GET  /health
+
+Пример запуска:
+    python generation_server.py --port 8000 --preload gpt2
+    python generation_server.py --unix-socket /tmp/generator.sock
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from ai_text_generator import preload, run_many
+
+# Максимальный размер тела запроса в байтах
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class BatchScheduler:
+    """
+    Очередь запросов одной модели и цикл, собирающий их в пакеты.
+
+    Генерация выполняется в отдельном потоке (по одному на модель), поэтому
+    цикл событий не блокируется, а пакеты одной модели идут строго по очереди.
+    """
+
+    def __init__(self, model_id: str, max_batch_size: int, max_wait_ms: float, max_queue: int):
+        self.model_id = model_id
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: "asyncio.Queue[Tuple[str, Dict[str, Any], asyncio.Future]]" = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"generate-{model_id}")
+        self.batch_sizes: Deque[int] = deque(maxlen=1000)
+        self.batches = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def load(self) -> None:
+        """Загружает модель в потоке генерации, не блокируя цикл событий."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, preload, self.model_id)
+
+    def submit(self, prompt: str, gen_kwargs: Dict[str, Any]) -> asyncio.Future:
+        """
+        Ставит запрос в очередь.
+
+        Возвращает:
+            asyncio.Future: Future с результатом run_many для этого промпта.
+
+        Исключения:
+            asyncio.QueueFull: Если очередь модели заполнена.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((prompt, gen_kwargs, future))
+        return future
+
+    async def _collect(self) -> List[Tuple[str, Dict[str, Any], asyncio.Future]]:
+        """Ждет первый запрос, затем добирает пакет до max_batch_size или до истечения max_wait."""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Запросы, которые уже отменены по таймауту, не генерируем
+        return [item for item in batch if not item[2].done()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            # run_many принимает общие параметры, поэтому делим пакет по gen_kwargs
+            groups: Dict[str, List[Tuple[str, Dict[str, Any], asyncio.Future]]] = {}
+            for item in batch:
+                groups.setdefault(json.dumps(item[1], sort_keys=True, default=str), []).append(item)
+
+            for items in groups.values():
+                prompts = [prompt for prompt, _, _ in items]
+                self.batches += 1
+                self.batch_sizes.append(len(items))
+                try:
+                    results = await loop.run_in_executor(
+                        self.executor, lambda: run_many(self.model_id, prompts, batch_size=len(prompts), **items[0][1])
+                    )
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+
+
+class GenerationServer:
+    """HTTP-сервер поверх планировщиков BatchScheduler с метриками."""
+
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 20, max_queue: int = 64,
+                 default_timeout: float = 60):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.schedulers: Dict[str, BatchScheduler] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        self.latencies: Deque[float] = deque(maxlen=1000)
+        self.counters = {"requests": 0, "completed": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+
+    async def get_scheduler(self, model_id: str) -> BatchScheduler:
+        """Возвращает планировщик модели, создавая его и загружая модель при первом обращении."""
+        if model_id in self.schedulers:
+            return self.schedulers[model_id]
+        if model_id not in self._loading:
+            self._loading[model_id] = asyncio.create_task(self._create_scheduler(model_id))
+        try:
+            return await asyncio.shield(self._loading[model_id])
+        except Exception:
+            # Неудачную загрузку не запоминаем, чтобы следующий запрос попробовал снова
+            self._loading.pop(model_id, None)
+            raise
+
+    async def _create_scheduler(self, model_id: str) -> BatchScheduler:
+        scheduler = BatchScheduler(model_id, self.max_batch_size, self.max_wait_ms, self.max_queue)
+        try:
+            await scheduler.load()
+        except Exception:
+            await scheduler.stop()
+            raise
+        scheduler.start()
+        self.schedulers[model_id] = scheduler
+        return scheduler
+
+    async def generate(self, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Обрабатывает POST /generate. Возвращает (HTTP-статус, тело ответа)."""
+        model_id = payload.get("model_id")
+        prompt = payload.get("prompt")
+        gen_kwargs = payload.get("gen_kwargs") or {}
+        timeout = payload.get("timeout", self.default_timeout)
+        if not isinstance(model_id, str) or not model_id.strip():
+            return 400, {"error": "model_id должен быть непустой строкой"}
+        if not isinstance(prompt, str) or not prompt.strip():
+            return 400, {"error": "prompt должен быть непустой строкой"}
+        if not isinstance(gen_kwargs, dict):
+            return 400, {"error": "gen_kwargs должен быть объектом"}
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            return 400, {"error": "timeout должен быть положительным числом"}
+
+        self.counters["requests"] += 1
+        start = time.perf_counter()
+        try:
+            scheduler = await asyncio.wait_for(self.get_scheduler(model_id), timeout)
+            future = scheduler.submit(prompt, gen_kwargs)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            return 503, {"error": f"Очередь модели '{model_id}' переполнена, повторите позже"}
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            return 504, {"error": "Превышено время ожидания загрузки модели"}
+        except Exception as e:
+            self.counters["errors"] += 1
+            return 500, {"error": f"Ошибка при загрузке модели: {e}"}
+
+        remaining = max(timeout - (time.perf_counter() - start), 0.001)
+        try:
+            result = await asyncio.wait_for(future, remaining)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            return 504, {"error": "Превышено время ожидания генерации"}
+        except ValueError as e:
+            self.counters["errors"] += 1
+            return 400, {"error": str(e)}
+        except Exception as e:
+            self.counters["errors"] += 1
+            return 500, {"error": f"Ошибка генерации: {e}"}
+
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.counters["completed"] += 1
+        return 200, dict(result, latency=round(latency, 4))
+
+    def metrics(self) -> Dict[str, Any]:
+        """Метрики: счетчики запросов, глубина очередей, размеры пакетов, задержки."""
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * q / 100), len(latencies) - 1)], 4)
+
+        return {
+            **self.counters,
+            "latency_p50": percentile(50),
+            "latency_p95": percentile(95),
+            "models": {
+                model_id: {
+                    "queue_depth": scheduler.queue.qsize(),
+                    "batches": scheduler.batches,
+                    "mean_batch_size": round(sum(scheduler.batch_sizes) / len(scheduler.batch_sizes), 2)
+                    if scheduler.batch_sizes else None,
+                }
+                for model_id, scheduler in self.schedulers.items()
+            },
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Обрабатывает одно HTTP-соединение (один запрос, затем соединение закрывается)."""
+        try:
+            status, body = await self._dispatch(reader)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, body = 400, {"error": f"Некорректный HTTP-запрос: {e}"}
+
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                  500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}[status]
+        headers = [f"HTTP/1.1 {status} {reason}", "Content-Type: application/json; charset=utf-8",
+                   f"Content-Length: {len(data)}", "Connection: close"]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("ascii") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader: asyncio.StreamReader) -> Tuple[int, Dict[str, Any]]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise ValueError(request_line or "пустой запрос")
+        method, path, _ = parts
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "models": list(self.schedulers)}
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        if method == "POST" and path == "/generate":
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_BYTES:
+                return 413, {"error": "Слишком большое тело запроса"}
+            try:
+                payload = json.loads(await reader.readexactly(length))
+            except json.JSONDecodeError as e:
+                return 400, {"error": f"Некорректный JSON: {e}"}
+            if not isinstance(payload, dict):
+                return 400, {"error": "Тело запроса должно быть JSON-объектом"}
+            return await self.generate(payload)
+        return 404, {"error": f"Неизвестный маршрут: {method} {path}"}
+
+    async def close(self) -> None:
+        for scheduler in self.schedulers.values():
+            await scheduler.stop()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """Запускает сервер и обслуживает запросы до остановки процесса."""
+    server = GenerationServer(args.max_batch_size, args.max_wait_ms, args.max_queue, args.timeout)
+    for model_id in args.preload or []:
+        print(f"Загрузка модели {model_id}...")
+        await server.get_scheduler(model_id)
+
+    if args.unix_socket:
+        listener = await asyncio.start_unix_server(server.handle, path=args.unix_socket)
+        print(f"Сервер слушает unix-сокет {args.unix_socket}")
+    else:
+        listener = await asyncio.start_server(server.handle, host=args.host, port=args.port)
+        print(f"Сервер слушает http://{args.host}:{args.port}")
+
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Локальный сервер генерации текста с микробатчингом")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", help="Слушать unix-сокет вместо TCP")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Максимальный размер пакета")
+    parser.add_argument("--max-wait-ms", type=float, default=20, help="Сколько ждать добора пакета, мс")
+    parser.add_argument("--max-queue", type=int, default=64, help="Максимальная длина очереди на модель")
+    parser.add_argument("--timeout", type=float, default=60, help="Таймаут запроса по умолчанию, с")
+    parser.add_argument("--preload", action="append", help="Загрузить модель при старте (можно несколько раз)")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    if args.max_batch_size < 1 or args.max_queue < 1 or args.max_wait_ms < 0:
+        print("Ошибка: max-batch-size и max-queue должны быть положительными, max-wait-ms — неотрицательным",
+              file=sys.stderr)
+        sys.exit(2)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
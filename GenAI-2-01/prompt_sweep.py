@@ -0,0 +1,224 @@
+"""
+Перебор промптов и параметров генерации для промпт-инжиниринга.
+
+Сетка промпты × параметры генерации прогоняется с одной загрузкой каждой модели.
+Детерминированные настройки (do_sample=False) идут пакетами через run_many; разные
+модели обрабатываются параллельно в пуле потоков (один поток на модель, так как
+токенизатор и модель не рассчитаны на одновременные вызовы из нескольких потоков).
+Настройки с сэмплированием выполняются после этого последовательно через run_model:
+сид фиксируется перед каждым вызовом, поэтому результат ячейки не зависит от соседей
+по пакету и совпадает с ручным вызовом.
+
+Пример:
+    python prompt_sweep.py --model gpt2 --prompt "Story about Mars" \
+        --grid max_new_tokens=40,80 --grid no_repeat_ngram_size=0,2 --workers 2 --csv sweep.csv
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Union
+
+from ai_text_generator import get_generator, preload, run_many, run_model
+
+
+def expand_grid(grid: Union[Dict[str, List[Any]], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Разворачивает сетку параметров в список наборов gen_kwargs.
+
+    Параметры:
+        grid: Словарь {параметр: [значения]} (декартово произведение) или готовый список наборов.
+
+    Возвращает:
+        list[dict]: Наборы параметров генерации.
+    """
+    if isinstance(grid, list):
+        return [dict(settings) for settings in grid]
+    if not grid:
+        return [{}]
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _new_tokens(model_id: str, result: Dict[str, Any]) -> int:
+    """Число токенов в сгенерированном продолжении."""
+    continuation = result["generated_text"][len(result["prompt"]):]
+    return len(get_generator(model_id).tokenizer(continuation)["input_ids"])
+
+
+def _cells(model_id: str, start_idx: int, settings: Dict[str, Any], results: List[Dict[str, Any]],
+           latency: float) -> List[Dict[str, Any]]:
+    """
+    Строки таблицы результатов для ячеек, сгенерированных одним вызовом. latency и tokens_per_sec
+    относятся ко всему вызову (все токены вызова / его время): при batch_size > 1 это показатели
+    пакета (timing="batch"), одинаковые для всех его ячеек, а не время отдельной ячейки.
+    """
+    new_tokens = [_new_tokens(model_id, result) for result in results]
+    tokens_per_sec = round(sum(new_tokens) / latency, 2) if latency > 0 else None
+    return [{
+        "model": model_id,
+        "prompt_idx": start_idx + i,
+        "settings": settings,
+        "total_words": result["total_words"],
+        "new_words": result["new_words"],
+        "new_tokens": tokens,
+        "batch_size": len(results),
+        "timing": "batch" if len(results) > 1 else "cell",
+        "latency": round(latency, 4),
+        "tokens_per_sec": tokens_per_sec,
+        "generated_text": result["generated_text"],
+    } for i, (result, tokens) in enumerate(zip(results, new_tokens))]
+
+
+def _run_batched(model_id: str, prompts: List[str], settings: Dict[str, Any], batch_size: int) -> List[Dict[str, Any]]:
+    """Детерминированная настройка: все промпты пакетами. Задержка и токены/с — показатели пакета."""
+    cells = []
+    for start in range(0, len(prompts), batch_size):
+        chunk = prompts[start:start + batch_size]
+        started = time.perf_counter()
+        results = run_many(model_id, chunk, batch_size=batch_size, **settings)
+        cells.extend(_cells(model_id, start, settings, results, time.perf_counter() - started))
+    return cells
+
+
+def _run_model_settings(model_id: str, prompts: List[str], all_settings: List[Dict[str, Any]],
+                        batch_size: int) -> List[Dict[str, Any]]:
+    """Все детерминированные настройки одной модели, по очереди."""
+    cells = []
+    for settings in all_settings:
+        cells.extend(_run_batched(model_id, prompts, settings, batch_size))
+    return cells
+
+
+def _run_serial(model_id: str, prompts: List[str], settings: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Настройка с сэмплированием: по одному вызову run_model на промпт."""
+    cells = []
+    for i, prompt in enumerate(prompts):
+        started = time.perf_counter()
+        result = run_model(model_id, prompt, **settings)
+        cells.extend(_cells(model_id, i, settings, [result], time.perf_counter() - started))
+    return cells
+
+
+def run_sweep(model_ids: List[str], prompts: List[str], grid: Union[Dict[str, List[Any]], List[Dict[str, Any]]],
+              batch_size: int = 8, workers: int = 1) -> List[Dict[str, Any]]:
+    """
+    Прогоняет сетку модели × промпты × параметры генерации.
+
+    Параметры:
+        model_ids (list[str]): Модели; каждая загружается один раз.
+        prompts (list[str]): Промпты.
+        grid: Сетка параметров генерации (см. expand_grid).
+        batch_size (int): Размер пакета для детерминированных настроек.
+        workers (int): Число потоков для параллельной обработки разных моделей.
+
+    Возвращает:
+        list[dict]: По строке на ячейку: model, prompt_idx, settings, total_words, new_words,
+        new_tokens, batch_size, timing, latency (сек), tokens_per_sec, generated_text.
+        Для ячеек пакета (timing="batch") latency и tokens_per_sec — время и пропускная способность
+        всего пакета из batch_size промптов; timing="cell" — замер одной ячейки.
+    """
+    if not prompts:
+        raise ValueError("prompts не должен быть пустым")
+    if workers < 1:
+        raise ValueError("workers должен быть положительным")
+    all_settings = expand_grid(grid)
+
+    for model_id in model_ids:
+        preload(model_id)
+
+    deterministic = [settings for settings in all_settings if not settings.get("do_sample", False)]
+    sampled = [settings for settings in all_settings if settings.get("do_sample", False)]
+
+    cells: List[Dict[str, Any]] = []
+    if deterministic:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_model_settings, model_id, prompts, deterministic, batch_size)
+                       for model_id in model_ids]
+            for future in futures:
+                cells.extend(future.result())
+
+    # Сэмплирование использует глобальный сид, поэтому выполняется последовательно
+    for model_id in model_ids:
+        for settings in sampled:
+            cells.extend(_run_serial(model_id, prompts, settings))
+
+    # Возвращаем ячейки в порядке сетки независимо от порядка завершения задач
+    settings_order = {id(settings): i for i, settings in enumerate(all_settings)}
+    cells.sort(key=lambda cell: (model_ids.index(cell["model"]), settings_order[id(cell["settings"])],
+                                 cell["prompt_idx"]))
+    return cells
+
+
+def print_table(cells: List[Dict[str, Any]]) -> None:
+    """
+    Печатает таблицу результатов перебора. Для пакетных ячеек (timing 'batch/N') задержка
+    и токены/с — показатели всего пакета из N промптов.
+    """
+    print(f"{'model':<20}{'prompt':>7}  {'settings':<40}{'words':>7}{'new':>6}{'timing':>9}"
+          f"{'latency, с':>12}{'tok/s':>9}")
+    for cell in cells:
+        settings = json.dumps(cell["settings"], ensure_ascii=False)
+        new_words = "-" if cell["new_words"] is None else cell["new_words"]
+        timing = f"batch/{cell['batch_size']}" if cell["timing"] == "batch" else "cell"
+        print(f"{cell['model']:<20}{cell['prompt_idx']:>7}  {settings:<40}{cell['total_words']:>7}{new_words:>6}"
+              f"{timing:>9}{cell['latency']:>12}{str(cell['tokens_per_sec']):>9}")
+
+
+def save_csv(cells: List[Dict[str, Any]], path: str) -> None:
+    """Сохраняет результаты перебора в CSV (settings — JSON-строкой)."""
+    columns = ["model", "prompt_idx", "settings", "total_words", "new_words", "new_tokens", "batch_size",
+               "timing", "latency", "tokens_per_sec", "generated_text"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for cell in cells:
+            writer.writerow(dict(cell, settings=json.dumps(cell["settings"], ensure_ascii=False)))
+
+
+def _parse_value(raw: str) -> Any:
+    """Преобразует значение из командной строки: числа и true/false через JSON, иначе строка."""
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return raw
+
+
+def parse_grid(items: List[str]) -> Dict[str, List[Any]]:
+    """Разбирает аргументы вида 'max_new_tokens=40,80' в сетку параметров."""
+    grid = {}
+    for item in items:
+        name, sep, values = item.partition("=")
+        if not sep or not name or not values:
+            raise ValueError(f"Ожидался формат имя=значение1,значение2: {item!r}")
+        grid[name] = [_parse_value(value) for value in values.split(",")]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор промптов и параметров генерации")
+    parser.add_argument("--model", action="append", help="Модель (можно указать несколько раз)")
+    parser.add_argument("--prompt", action="append", required=True, help="Промпт (можно указать несколько раз)")
+    parser.add_argument("--grid", action="append", default=[], help="Параметр и значения: имя=v1,v2")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--csv", help="Путь для сохранения результатов в CSV")
+    args = parser.parse_args()
+
+    try:
+        grid = parse_grid(args.grid)
+    except ValueError as e:
+        parser.error(str(e))
+
+    cells = run_sweep(args.model or ["gpt2"], args.prompt, grid, batch_size=args.batch_size, workers=args.workers)
+    print_table(cells)
+    if args.csv:
+        save_csv(cells, args.csv)
+        print(f"\nРезультаты сохранены в: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import argparse
-from transformers import pipeline
+import os
+import queue
 import sys
+import threading
+import time
+from pathlib import Path
 
 def read_text_file(filepath):
     """
@@ -41,9 +45,122 @@ def create_summarizer(model_name="facebook/bart-large-cnn"):
     :param model_name: Имя модели для суммаризации
     :return: Объект pipeline для суммаризации
     """
+    # transformers импортируется только при создании модели, чтобы --help и ошибки ввода были мгновенными
+    from transformers import pipeline
     return pipeline('summarization', model=model_name)
 
-def summarize_text(summarizer, text, max_length=50, min_length=25):
+# Дистиллированный вариант BART-CNN: тот же токенизатор, декодер в 2 раза короче
+DISTILLED_MODEL = "sshleifer/distilbart-cnn-12-6"
+
+# Варианты декодирования от лучшего качества к самому быстрому. Первый — прежний режим
+# (полный beam search); length_scale — доля запрошенной max_length
+DECODING_LADDER = (
+    {'name': 'quality', 'num_beams': 4, 'distilled': False, 'length_scale': 1.0},
+    {'name': 'balanced', 'num_beams': 2, 'distilled': False, 'length_scale': 1.0},
+    {'name': 'balanced-distilled', 'num_beams': 2, 'distilled': True, 'length_scale': 1.0},
+    {'name': 'fast', 'num_beams': 1, 'distilled': True, 'length_scale': 1.0},
+    {'name': 'fast-short', 'num_beams': 1, 'distilled': True, 'length_scale': 0.5},
+)
+DECODING_TIERS = ('quality', 'balanced', 'fast')
+
+# Оценка стоимости дистиллированной модели относительно полной, пока она не измерена
+_DISTILLED_RELATIVE_COST = 0.5
+
+class DecodingPolicy:
+    """
+    Выбор параметров декодирования (число лучей, max_length, дистиллированная модель)
+    по уровню качества или бюджету задержки.
+    
+    С уровнем tier ('quality', 'balanced', 'fast') и без бюджета всегда используется вариант уровня.
+    С бюджетом latency_budget (секунд на текст) для каждого пакета выбирается лучший вариант,
+    не выше tier, чья оценка времени укладывается в бюджет. Оценка строится по измеренной
+    пропускной способности: секунды на единицу работы (токены входа + лучи × max_length),
+    сглаженные по последним пакетам. Пока модель не измерена, берется самый дешевый вариант.
+    
+    :param tier: Уровень качества (по умолчанию 'quality')
+    :param latency_budget: Бюджет задержки на один текст в секундах (None — без бюджета)
+    :param distilled: pipeline дистиллированной модели; без него варианты с ней используют основную
+    """
+    
+    def __init__(self, tier=None, latency_budget=None, distilled=None):
+        if tier is not None and tier not in DECODING_TIERS:
+            raise ValueError(f"Unknown tier: {tier!r} (expected one of {', '.join(DECODING_TIERS)})")
+        if latency_budget is not None and latency_budget <= 0:
+            raise ValueError("latency_budget must be positive")
+        self.tier = tier or 'quality'
+        self.latency_budget = latency_budget
+        self.distilled = distilled
+        # Секунды на единицу работы для 'base' и 'distilled'
+        self.seconds_per_unit = {}
+        self.choices = {}
+        start = [option['name'] for option in DECODING_LADDER].index(self.tier)
+        self._options = DECODING_LADDER[start:] if latency_budget is not None else DECODING_LADDER[start:start + 1]
+    
+    def _model_key(self, option):
+        return 'distilled' if option['distilled'] and self.distilled is not None else 'base'
+    
+    def _cost(self, model_key):
+        """Оценка секунд на единицу работы (None, если ни одна модель не измерена)."""
+        if model_key in self.seconds_per_unit:
+            return self.seconds_per_unit[model_key]
+        if model_key == 'distilled' and 'base' in self.seconds_per_unit:
+            return self.seconds_per_unit['base'] * _DISTILLED_RELATIVE_COST
+        if model_key == 'base' and 'distilled' in self.seconds_per_unit:
+            return self.seconds_per_unit['distilled'] / _DISTILLED_RELATIVE_COST
+        return None
+    
+    @staticmethod
+    def _units(option, input_tokens, max_length):
+        return input_tokens + option['num_beams'] * max(1, int(max_length * option['length_scale']))
+    
+    def estimate(self, option, input_tokens, max_length):
+        """Оценка времени на один текст в секундах для варианта option (None, если нет замеров)."""
+        cost = self._cost(self._model_key(option))
+        return None if cost is None else cost * self._units(option, input_tokens, max_length)
+    
+    def choose(self, input_tokens, max_length):
+        """Выбирает вариант декодирования для пакета, самый длинный текст которого — input_tokens токенов."""
+        chosen = self._options[-1]
+        if self.latency_budget is None:
+            chosen = self._options[0]
+        else:
+            for option in self._options:
+                estimate = self.estimate(option, input_tokens, max_length)
+                if estimate is not None and estimate <= self.latency_budget:
+                    chosen = option
+                    break
+        self.choices[chosen['name']] = self.choices.get(chosen['name'], 0) + 1
+        return chosen
+    
+    def decode(self, summarizer, option, max_length, min_length):
+        """Возвращает pipeline и параметры generate для варианта option."""
+        model = self.distilled if self._model_key(option) == 'distilled' else summarizer
+        return model, decoding_kwargs(option['num_beams'], max(1, int(max_length * option['length_scale'])),
+                                      min_length)
+    
+    def record(self, option, input_tokens, max_length, batch_size, seconds):
+        """Учитывает фактическое время пакета из batch_size текстов."""
+        key = self._model_key(option)
+        observed = seconds / (batch_size * self._units(option, input_tokens, max_length))
+        previous = self.seconds_per_unit.get(key)
+        self.seconds_per_unit[key] = observed if previous is None else 0.7 * previous + 0.3 * observed
+    
+    def stats(self):
+        """Сколько пакетов обработано каждым вариантом и измеренная стоимость моделей."""
+        return {'tier': self.tier, 'latency_budget': self.latency_budget, 'choices': dict(self.choices),
+                'seconds_per_unit': dict(self.seconds_per_unit)}
+
+def decoding_kwargs(num_beams, max_length, min_length):
+    """
+    Параметры генерации. При num_beams=1 используется жадное декодирование
+    (length_penalty и early_stopping имеют смысл только для beam search).
+    """
+    kwargs = {'max_length': max_length, 'min_length': min(min_length, max_length), 'num_beams': num_beams}
+    if num_beams > 1:
+        kwargs.update(length_penalty=2.0, early_stopping=True)
+    return kwargs
+
+def summarize_text(summarizer, text, max_length=50, min_length=25, policy=None):
     """
     Формирует краткое резюме текста с использованием переданного summarizer.
     
@@ -51,17 +168,343 @@ def summarize_text(summarizer, text, max_length=50, min_length=25):
     :param text: Исходный текст
     :param max_length: Максимальная длина резюме
     :param min_length: Минимальная длина резюме
+    :param policy: DecodingPolicy для выбора параметров декодирования (None — полный beam search)
     :return: Резюме текста
     """
-    # Вызов pipeline для создания резюме с заданными параметрами
-    result = summarizer(text, max_length=max_length, min_length=min_length, length_penalty=2.0, num_beams=4, early_stopping=True)
-    return result[0]['summary_text']
+    return summarize_texts(summarizer, [text], max_length=max_length, min_length=min_length, batch_size=1,
+                           policy=policy, raise_errors=True)[0]
+
+def summarize_texts(summarizer, texts, max_length=50, min_length=25, batch_size=8, policy=None,
+                    raise_errors=False):
+    """
+    Формирует резюме для списка текстов пакетами.
+    
+    Тексты сортируются по длине в токенах, чтобы в пакет попадали тексты близкой длины
+    и на паддинг уходило меньше вычислений; результаты возвращаются в исходном порядке.
+    Если пакет не удалось обработать, его тексты суммаризируются по одному;
+    для текстов, которые не удалось суммаризировать, возвращается None.
+    
+    :param summarizer: pipeline для суммаризации
+    :param texts: Список исходных текстов
+    :param max_length: Максимальная длина резюме
+    :param min_length: Минимальная длина резюме
+    :param batch_size: Размер пакета
+    :param policy: DecodingPolicy: параметры декодирования выбираются для каждого пакета
+                   (None — полный beam search)
+    :param raise_errors: Пробрасывать ошибку вместо None (для одного текста)
+    :return: Список резюме (или None) в порядке texts
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+    lengths = [len(ids) for ids in summarizer.tokenizer(list(texts))['input_ids']] if texts else []
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    summaries = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        # Самый длинный текст пакета определяет время его обработки
+        input_tokens = lengths[batch[-1]]
+        if policy is None:
+            option = None
+            model, kwargs = summarizer, decoding_kwargs(4, max_length, min_length)
+        else:
+            option = policy.choose(input_tokens, max_length)
+            model, kwargs = policy.decode(summarizer, option, max_length, min_length)
+        try:
+            started = time.perf_counter()
+            results = model([texts[i] for i in batch], batch_size=len(batch), **kwargs)
+            if option is not None:
+                policy.record(option, input_tokens, max_length, len(batch), time.perf_counter() - started)
+            for i, result in zip(batch, results):
+                summaries[i] = result['summary_text']
+        except Exception:
+            if raise_errors and len(batch) == 1:
+                raise
+            # Пакет целиком не прошел: пробуем тексты по одному, чтобы ошибка одного не теряла остальные
+            for i in batch:
+                try:
+                    summaries[i] = model(texts[i], **kwargs)[0]['summary_text']
+                except Exception:
+                    if raise_errors:
+                        raise
+                    summaries[i] = None
+    return summaries
+
+def input_token_limit(summarizer):
+    """
+    Максимальное число токенов текста, которое модель принимает за один вызов
+    (без служебных токенов).
+    
+    :param summarizer: pipeline для суммаризации
+    :return: Лимит в токенах
+    """
+    tokenizer = summarizer.tokenizer
+    limit = getattr(summarizer.model.config, 'max_position_embeddings', None) or tokenizer.model_max_length
+    # model_max_length у некоторых токенизаторов — «бесконечность» (очень большое число)
+    limit = min(limit, tokenizer.model_max_length)
+    return limit - tokenizer.num_special_tokens_to_add()
+
+def split_into_chunks(tokenizer, text, max_tokens):
+    """
+    Делит текст на части не длиннее max_tokens токенов по границам токенов.
+    
+    Части получаются примерно одинаковой длины, чтобы последняя не оказалась слишком короткой.
+    
+    :param tokenizer: Токенизатор модели
+    :param text: Исходный текст
+    :param max_tokens: Максимальная длина части в токенах
+    :return: Список частей текста
+    """
+    if max_tokens < 1:
+        raise ValueError("max_tokens must be positive")
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=tokenizer.is_fast)
+    ids = encoding['input_ids']
+    if len(ids) <= max_tokens:
+        return [text]
+    n_chunks = -(-len(ids) // max_tokens)
+    size = -(-len(ids) // n_chunks)
+    chunks = []
+    for start in range(0, len(ids), size):
+        end = min(start + size, len(ids))
+        if tokenizer.is_fast:
+            # Берем фрагмент исходного текста по смещениям токенов, чтобы не искажать его декодированием
+            offsets = encoding['offset_mapping']
+            chunks.append(text[offsets[start][0]:offsets[end - 1][1]].strip())
+        else:
+            chunks.append(tokenizer.decode(ids[start:end]).strip())
+    return chunks
+
+def summarize_long_texts(summarizer, texts, max_length=50, min_length=25, batch_size=8, max_rounds=3,
+                         policy=None):
+    """
+    Иерархическая (map-reduce) суммаризация текстов любой длины.
+    
+    Тексты длиннее окна модели делятся на части по границам токенов; части всех текстов
+    суммаризируются вместе пакетами (map), частичные резюме каждого текста объединяются и, если
+    все еще не помещаются в окно, обрабатываются снова (reduce). После max_rounds раундов
+    остаток обрезается по окну модели, поэтому задержка ограничена. Тексты, помещающиеся в окно,
+    суммаризируются как в summarize_texts.
+    
+    :param summarizer: pipeline для суммаризации
+    :param texts: Список исходных текстов
+    :param max_length: Максимальная длина резюме
+    :param min_length: Минимальная длина резюме
+    :param batch_size: Размер пакета
+    :param max_rounds: Максимум раундов map-reduce
+    :param policy: DecodingPolicy (см. summarize_texts)
+    :return: Список резюме (или None) в порядке texts
+    """
+    tokenizer = summarizer.tokenizer
+    limit = input_token_limit(summarizer)
+    current = list(texts)
+    failed = set()
+    for _ in range(max_rounds):
+        chunked = {}
+        for i, text in enumerate(current):
+            if i not in failed:
+                chunks = split_into_chunks(tokenizer, text, limit)
+                if len(chunks) > 1:
+                    chunked[i] = chunks
+        if not chunked:
+            break
+        # Map: части всех длинных текстов — одним набором пакетов
+        flat = [chunk for chunks in chunked.values() for chunk in chunks]
+        partials = summarize_texts(summarizer, flat, max_length=max_length, min_length=min_length,
+                                   batch_size=batch_size, policy=policy)
+        position = 0
+        for i, chunks in chunked.items():
+            parts = [p for p in partials[position:position + len(chunks)] if p is not None]
+            position += len(chunks)
+            if parts:
+                current[i] = " ".join(parts)
+            else:
+                failed.add(i)
+    else:
+        # Раунды исчерпаны: оставшиеся длинные тексты обрезаются по окну модели
+        current = [split_into_chunks(tokenizer, text, limit)[0] if i not in failed else text
+                   for i, text in enumerate(current)]
+
+    # Reduce: итоговые резюме всех текстов одним набором пакетов
+    pending = [i for i in range(len(current)) if i not in failed]
+    finals = summarize_texts(summarizer, [current[i] for i in pending], max_length=max_length,
+                             min_length=min_length, batch_size=batch_size, policy=policy)
+    summaries = [None] * len(current)
+    for i, summary in zip(pending, finals):
+        summaries[i] = summary
+    return summaries
+
+def summarize_long_text(summarizer, text, max_length=50, min_length=25, batch_size=8, max_rounds=3,
+                        policy=None):
+    """
+    Иерархическая суммаризация одного текста любой длины (см. summarize_long_texts).
+    
+    :raises RuntimeError: Если резюме не удалось получить
+    """
+    summary = summarize_long_texts(summarizer, [text], max_length=max_length, min_length=min_length,
+                                   batch_size=batch_size, max_rounds=max_rounds, policy=policy)[0]
+    if summary is None:
+        raise RuntimeError("Summarization failed")
+    return summary
+
+def find_pending_files(input_dir, pattern, output_dir):
+    """
+    Находит входные файлы, для которых резюме нужно построить заново.
+    
+    Резюме считается актуальным, если выходной файл существует и не старше входного.
+    
+    :param input_dir: Каталог с входными файлами
+    :param pattern: Шаблон имен файлов (glob, допускается '**')
+    :param output_dir: Каталог для резюме (структура подкаталогов сохраняется)
+    :return: (список пар (входной путь, выходной путь), число пропущенных актуальных файлов)
+    """
+    input_root, output_root = Path(input_dir), Path(output_dir)
+    pending, skipped = [], 0
+    for source in sorted(input_root.glob(pattern)):
+        if not source.is_file():
+            continue
+        target = output_root / source.relative_to(input_root)
+        if target.exists() and target.stat().st_mtime >= source.stat().st_mtime:
+            skipped += 1
+            continue
+        pending.append((source, target))
+    return pending, skipped
+
+def _read_ahead(pairs, out_queue):
+    """
+    Читает файлы в фоновом потоке и кладет в очередь (входной путь, выходной путь, текст или ошибка).
+    Очередь ограничена, поэтому чтение опережает суммаризацию не больше чем на ее размер.
+    В конце в очередь кладется None.
+    """
+    for source, target in pairs:
+        try:
+            item = read_text_file(source)
+        except IOError as e:
+            item = e
+        out_queue.put((source, target, item))
+    out_queue.put(None)
+
+def summarize_directory(summarizer, pairs, batch_size=8, block_size=64, max_length=50, min_length=25,
+                        policy=None):
+    """
+    Суммаризирует файлы пакетами одной загруженной моделью.
+    
+    Файлы читаются в фоновом потоке с опережением; документы набираются в блоки по block_size,
+    каждый блок суммаризируется summarize_long_texts (пакеты по длине в токенах), и резюме блока
+    сразу записываются на диск.
+    
+    :param summarizer: pipeline для суммаризации
+    :param pairs: Список пар (входной путь, выходной путь)
+    :param batch_size: Размер пакета
+    :param block_size: Число документов в блоке
+    :param max_length: Максимальная длина резюме
+    :param min_length: Минимальная длина резюме
+    :param policy: DecodingPolicy (см. summarize_texts)
+    :return: (число записанных резюме, список (путь, текст ошибки))
+    """
+    documents = queue.Queue(maxsize=2 * block_size)
+    reader = threading.Thread(target=_read_ahead, args=(pairs, documents), daemon=True)
+    reader.start()
+    written, errors = 0, []
+    finished = False
+    while not finished:
+        block = []
+        while len(block) < block_size:
+            item = documents.get()
+            if item is None:
+                finished = True
+                break
+            source, target, text = item
+            if isinstance(text, Exception):
+                errors.append((source, str(text)))
+            else:
+                block.append((source, target, text))
+        if not block:
+            continue
+        summaries = summarize_long_texts(summarizer, [text for _, _, text in block], max_length=max_length,
+                                         min_length=min_length, batch_size=batch_size, policy=policy)
+        for (source, target, _), summary in zip(block, summaries):
+            if summary is None:
+                errors.append((source, "Summarization failed"))
+                continue
+            try:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                write_text_file(target, summary)
+                written += 1
+            except IOError as e:
+                errors.append((source, str(e)))
+    reader.join()
+    return written, errors
+
+def create_policy(tier=None, latency_budget_ms=None):
+    """
+    Создает DecodingPolicy по параметрам CLI (None, если не задан ни уровень, ни бюджет).
+    Дистиллированная модель загружается заранее, только если политика может ее выбрать.
+    """
+    if tier is None and latency_budget_ms is None:
+        return None
+    distilled = None
+    if tier == 'fast' or latency_budget_ms is not None:
+        distilled = create_summarizer(DISTILLED_MODEL)
+    return DecodingPolicy(tier, None if latency_budget_ms is None else latency_budget_ms / 1000,
+                          distilled=distilled)
+
+def run_directory(args):
+    """
+    Пакетный режим CLI: суммаризирует файлы --input-dir по шаблону --glob в --output-dir.
+    Модель загружается один раз и только если есть файлы для обработки.
+    
+    :return: Код завершения (0 — успех, 1 — ошибка ввода, 2 — не все файлы обработаны)
+    """
+    if not os.path.isdir(args.input_dir):
+        print(f"Input directory '{args.input_dir}' not found", file=sys.stderr)
+        return 1
+    if os.path.abspath(args.input_dir) == os.path.abspath(args.output_dir):
+        print("--output-dir must differ from --input-dir", file=sys.stderr)
+        return 1
+    pending, skipped = find_pending_files(args.input_dir, args.glob, args.output_dir)
+    print(f"Files to summarize: {len(pending)}, up to date: {skipped}")
+    if not pending:
+        return 0
+
+    # Загрузка модели (один раз на все файлы)
+    summarizer = create_summarizer()
+    policy = create_policy(args.tier, args.latency_budget_ms)
+    written, errors = summarize_directory(summarizer, pending, batch_size=args.batch_size,
+                                          block_size=args.block_size, policy=policy)
+    if policy is not None:
+        print(f"Decoding: {policy.stats()['choices']}")
+    for source, message in errors:
+        print(f"{source}: {message}", file=sys.stderr)
+    print(f"Summaries saved to '{args.output_dir}': {written}, failed: {len(errors)}")
+    return 2 if errors else 0
 
 def main():
     parser = argparse.ArgumentParser(description="Text summarization with BART")
-    parser.add_argument("--input", type=str, required=True, help="Path to input text file")
-    parser.add_argument("--output", type=str, required=True, help="Path to output summary file")
+    parser.add_argument("--input", type=str, help="Path to input text file")
+    parser.add_argument("--output", type=str, help="Path to output summary file")
+    parser.add_argument("--input-dir", type=str, help="Directory with input text files (batch mode)")
+    parser.add_argument("--glob", type=str, default="*.txt",
+                        help="File name pattern inside --input-dir, '**' for subdirectories (default: *.txt)")
+    parser.add_argument("--output-dir", type=str, help="Directory for summaries (batch mode)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Summarization batch size (batch mode)")
+    parser.add_argument("--block-size", type=int, default=64,
+                        help="Documents summarized and written together (batch mode)")
+    parser.add_argument("--tier", choices=DECODING_TIERS, default=None,
+                        help="Decoding tier: quality (4 beams, default), balanced (2 beams) "
+                             "or fast (greedy, distilled model)")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Latency budget per document: decoding is chosen from measured throughput")
     args = parser.parse_args()
+    if args.latency_budget_ms is not None and args.latency_budget_ms <= 0:
+        parser.error("--latency-budget-ms must be positive")
+
+    if args.input_dir or args.output_dir:
+        if not (args.input_dir and args.output_dir) or args.input or args.output:
+            parser.error("batch mode requires --input-dir and --output-dir without --input/--output")
+        if args.batch_size < 1 or args.block_size < 1:
+            parser.error("--batch-size and --block-size must be positive")
+        sys.exit(run_directory(args))
+    if not (args.input and args.output):
+        parser.error("either --input and --output or --input-dir and --output-dir are required")
 
     try:
         # Чтение входного текста
@@ -72,10 +515,12 @@ def main():
 
     # Загрузка модели
     summarizer = create_summarizer()
+    policy = create_policy(args.tier, args.latency_budget_ms)
 
     try:
         # Получение резюме текста
-        summary = summarize_text(summarizer, text)
+        # Длинные тексты суммаризируются по частям (map-reduce), короткие — как раньше
+        summary = summarize_long_text(summarizer, text, policy=policy)
     except Exception as e:
         # Ошибка в процессе суммаризации
         print(f"Error during summarization: {e}", file=sys.stderr)
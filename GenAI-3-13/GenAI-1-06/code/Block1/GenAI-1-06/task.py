@@ -3,9 +3,6 @@ from pathlib import Path
 from enum import Enum
 import os.path
 
-import torch
-from transformers import pipeline
-
 # Этот код был изменен, чтобы его можно было импортировать как модуль.
 # Оригинальная функциональность для прямого запуска сохранена в блоке if __name__ == "__main__".
 
@@ -41,21 +38,39 @@ def convert_to_readable(predicts: list[dict], texts: list[str]) -> list[dict]:
     return readable_results
 
 
-def analyze_sentiment_from_texts(texts: list[str]) -> list[dict]:
+SENTIMENT_MODEL = 'nlptown/bert-base-multilingual-uncased-sentiment'
+
+
+def load_sentiment_model(model: str = SENTIMENT_MODEL, **pipeline_kwargs):
+    """
+    Загружает модель анализа тональности.
+    Позволяет загрузить модель один раз и переиспользовать ее в analyze_sentiment_from_texts.
+    model — имя модели в Hub или путь к локальной копии; pipeline_kwargs передаются в pipeline.
+    """
+    # transformers импортируется при первой загрузке модели, чтобы импорт модуля был быстрым
+    from transformers import pipeline
+
+    classifier = pipeline('sentiment-analysis', model=model, **pipeline_kwargs)
+    print("Модель анализа тональности (GenAI-1-06) загружена.")
+    return classifier
+
+
+def analyze_sentiment_from_texts(texts: list[str], classifier=None) -> list[dict]:
     """
     Анализирует список текстов на тональность.
     Это основная функция для импорта и использования в других модулях.
+    Если classifier не передан, модель загружается при вызове функции.
     """
     if not texts:
         return []
         
-    try:
-        # Загружаем модель только при вызове функции
-        classifier = pipeline('sentiment-analysis', model='nlptown/bert-base-multilingual-uncased-sentiment')
-        print("Модель анализа тональности (GenAI-1-06) загружена.")
-    except Exception as e:
-        print(f"Ошибка при загрузке модели sentiment-analysis: {e}")
-        return []
+    if classifier is None:
+        try:
+            # Загружаем модель только при вызове функции
+            classifier = load_sentiment_model()
+        except Exception as e:
+            print(f"Ошибка при загрузке модели sentiment-analysis: {e}")
+            return []
 
     predicts = classifier(texts)
     
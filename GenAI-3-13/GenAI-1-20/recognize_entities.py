@@ -4,11 +4,13 @@
 """
 
 import sys
-from transformers import pipeline
 from typing import List, Dict, Any
 
 def load_ner_model():
     """Загружает и инициализирует NER-модель."""
+    # transformers импортируется при первой загрузке модели, чтобы импорт модуля был быстрым
+    from transformers import pipeline
+
     print("Загрузка NER-модели...")
     ner_pipeline = pipeline('ner', model='dslim/bert-base-NER', aggregation_strategy='simple')
     print("Модель успешно загружена.")
@@ -27,6 +29,31 @@ def recognize_entities(ner_pipeline, text: str) -> List[Dict[str, Any]]:
     """Распознает именованные сущности в тексте."""
     return ner_pipeline(text)
 
+def recognize_entities_batch(ner_pipeline, texts: List[str], batch_size: int = 16) -> List[List[Dict[str, Any]]]:
+    """
+    Распознает именованные сущности в списке текстов пакетами.
+
+    Тексты сортируются по длине, чтобы в один пакет попадали тексты близкой длины
+    и на паддинг уходило меньше вычислений. Результаты возвращаются в исходном порядке.
+
+    Args:
+        ner_pipeline: NER-pipeline.
+        texts (List[str]): Тексты для анализа.
+        batch_size (int): Размер пакета для модели.
+
+    Returns:
+        List[List[Dict[str, Any]]]: Список сущностей для каждого текста, в порядке texts.
+    """
+    if not texts:
+        return []
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    predictions = ner_pipeline([texts[i] for i in order], batch_size=batch_size)
+
+    results: List[List[Dict[str, Any]]] = [[] for _ in texts]
+    for i, entities in zip(order, predictions):
+        results[i] = entities
+    return results
+
 def highlight_entities(text: str, entities: List[Dict[str, Any]]) -> str:
     """Подсвечивает распознанные сущности в исходном тексте."""
     for entity in reversed(entities):
@@ -50,8 +77,9 @@ def process_ner_from_file(file_path: str) -> Dict[str, Any]:
                         - 'entities': список найденных сущностей.
                         - 'highlighted_text': текст с подсветкой.
     """
-    ner_model = load_ner_model()
+    # Сначала читаем файл: ошибка пути не должна ждать загрузки модели
     text_to_analyze = read_text_from_file(file_path)
+    ner_model = load_ner_model()
     found_entities = recognize_entities(ner_model, text_to_analyze)
     highlighted_version = highlight_entities(text_to_analyze, found_entities)
     
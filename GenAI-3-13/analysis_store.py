@@ -0,0 +1,105 @@
+"""
+Хранилище результатов анализа отзывов (тональность и аспекты) в SQLite.
+
+Ключ записи — sha256 от нормализованного текста отзыва и версий моделей, поэтому при
+повторном запуске инференс выполняется только для новых или измененных отзывов, а смена
+модели автоматически делает старые записи неактуальными. Результаты фиксируются после
+каждой порции отзывов, так что прерванный запуск продолжается с последней сохраненной порции.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import unicodedata
+
+# Максимальное число параметров в одном запросе SELECT ... IN (...)
+_LOOKUP_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """Нормализует текст отзыва для ключа: Unicode NFC и схлопнутые пробелы."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def model_versions(models: dict, names) -> dict:
+    """
+    Возвращает версии моделей для ключа хранилища: имя модели и ревизию (commit hash) из Hub.
+
+    Параметры:
+        models (dict): Загруженные пайплайны transformers.
+        names: Имена моделей из models, от которых зависит результат анализа.
+    """
+    versions = {}
+    for name in names:
+        if models[name] is None:
+            # Модель не загрузилась (например, тональность): такие результаты не сохраняются
+            versions[name] = None
+            continue
+        model = models[name].model
+        versions[name] = f"{model.name_or_path}@{getattr(model.config, '_commit_hash', None)}"
+    return versions
+
+
+class AnalysisStore:
+    """
+    Персистентное хранилище результатов анализа отзывов.
+
+    Запись: ключ -> (sentiment, confidence, aspects). Несколько процессов могут работать
+    с одним файлом одновременно (журнал WAL, ожидание блокировки).
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reviews ("
+            "key TEXT PRIMARY KEY, sentiment TEXT NOT NULL, confidence REAL NOT NULL, aspects TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, versions: dict) -> str:
+        """Строит ключ записи по нормализованному тексту и версиям моделей."""
+        payload = json.dumps([normalize_text(text), versions], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        """Возвращает найденные записи: {ключ: (sentiment, confidence, aspects)}."""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[start:start + _LOOKUP_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, sentiment, confidence, aspects FROM reviews WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, sentiment, confidence, aspects in rows:
+                found[key] = (sentiment, confidence, json.loads(aspects))
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, results: dict) -> None:
+        """Сохраняет записи {ключ: (sentiment, confidence, aspects)} и фиксирует транзакцию (чекпоинт)."""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO reviews (key, sentiment, confidence, aspects) VALUES (?, ?, ?, ?)",
+            [(key, sentiment, confidence, json.dumps(aspects, ensure_ascii=False))
+             for key, (sentiment, confidence, aspects) in results.items()],
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        self._conn.close()
+
+    def stats(self) -> dict:
+        """Возвращает счетчики попаданий и число записей в хранилище."""
+        entries = self._conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+        return {"path": self.path, "hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,131 @@
+"""
+Подсчет упоминаний аспектов с ограниченной памятью.
+
+AspectCounter хранит точные частоты, пока уникальных аспектов не больше max_unique,
+а затем переключается на алгоритм Space-Saving (Metwally et al.): хранится не более
+max_unique счетчиков, и частые аспекты гарантированно остаются в топе. Счетчики разных
+порций отзывов объединяются через merge, поэтому подходят для потоковой и параллельной
+обработки.
+"""
+
+import heapq
+from collections import Counter
+
+
+def is_valid_aspect(aspect: str) -> bool:
+    """Отсекает мусорные токены NER: обрывки слов ('##...') и одиночные символы."""
+    return isinstance(aspect, str) and not aspect.startswith('##') and len(aspect) > 1
+
+
+class AspectCounter:
+    """
+    Частоты аспектов одной группы отзывов (например, продукт × тональность).
+
+    Параметры:
+        max_unique (int): Максимум хранимых аспектов; None — без ограничения (всегда точный подсчет).
+    """
+
+    def __init__(self, max_unique: int = None):
+        if max_unique is not None and max_unique < 1:
+            raise ValueError("max_unique должен быть положительным")
+        self.max_unique = max_unique
+        self._counts = Counter()
+        # Верхняя оценка ошибки для аспектов, вытесненных и снова добавленных (Space-Saving)
+        self._errors = {}
+        # Куча (частота, аспект) для поиска самого редкого аспекта в приближенном режиме;
+        # устаревшие записи отбрасываются при извлечении
+        self._heap = None
+        self.exact = True
+
+    def add(self, aspect: str, count: int = 1) -> None:
+        """Добавляет count упоминаний аспекта; мусорные токены NER пропускаются."""
+        if count <= 0 or not is_valid_aspect(aspect):
+            return
+        if aspect in self._counts or self.max_unique is None or len(self._counts) < self.max_unique:
+            self._counts[aspect] += count
+            if self._heap is not None:
+                self._push(aspect)
+            return
+        # Space-Saving: новый аспект замещает самый редкий и наследует его счетчик как ошибку
+        self.exact = False
+        if self._heap is None:
+            self._rebuild_heap()
+        victim, floor = self._pop_min()
+        del self._counts[victim]
+        self._errors.pop(victim, None)
+        self._counts[aspect] = floor + count
+        self._errors[aspect] = floor
+        self._push(aspect)
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(count, aspect) for aspect, count in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def _push(self, aspect: str) -> None:
+        heapq.heappush(self._heap, (self._counts[aspect], aspect))
+        if len(self._heap) > 4 * len(self._counts):
+            self._rebuild_heap()
+
+    def _pop_min(self) -> tuple:
+        """Извлекает самый редкий аспект, пропуская устаревшие записи кучи."""
+        while True:
+            count, aspect = heapq.heappop(self._heap)
+            if self._counts.get(aspect) == count:
+                return aspect, count
+
+    def update(self, aspects) -> None:
+        """Добавляет аспекты из итерируемого набора или словаря {аспект: число}."""
+        items = aspects.items() if isinstance(aspects, dict) else ((aspect, 1) for aspect in aspects)
+        for aspect, count in items:
+            self.add(aspect, count)
+
+    def merge(self, other: "AspectCounter") -> None:
+        """
+        Добавляет частоты другого счетчика. В точном режиме результат совпадает с подсчетом
+        по объединенным данным; при превышении max_unique остаются самые частые аспекты.
+        """
+        self.exact = self.exact and other.exact
+        self._counts.update(other._counts)
+        for aspect, error in other._errors.items():
+            self._errors[aspect] = self._errors.get(aspect, 0) + error
+        if self.max_unique is not None and len(self._counts) > self.max_unique:
+            # Оставляем max_unique самых частых; остальные отбрасываются, как в Space-Saving
+            self.exact = False
+            kept = dict(self._top(self.max_unique))
+            self._errors = {aspect: error for aspect, error in self._errors.items() if aspect in kept}
+            self._counts = Counter(kept)
+        if self._heap is not None or not self.exact:
+            self._rebuild_heap()
+
+    @classmethod
+    def merged(cls, counters, max_unique: int = None) -> "AspectCounter":
+        """Новый счетчик, объединяющий counters."""
+        result = cls(max_unique)
+        for counter in counters:
+            result.merge(counter)
+        return result
+
+    def _top(self, k: int) -> list:
+        # При равной частоте — по алфавиту, чтобы результат был детерминированным
+        return heapq.nsmallest(k, self._counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def most_common(self, k: int = 5) -> list:
+        """
+        Возвращает до k самых частых аспектов: [(аспект, число упоминаний), ...].
+        В приближенном режиме число — верхняя оценка (завышение не больше error(aspect)).
+        """
+        return self._top(k)
+
+    def error(self, aspect: str) -> int:
+        """Максимальное завышение счетчика аспекта (0 при точном подсчете)."""
+        return self._errors.get(aspect, 0)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __bool__(self) -> bool:
+        return bool(self._counts)
+
+    def __repr__(self) -> str:
+        mode = "exact" if self.exact else "space-saving"
+        return f"AspectCounter({mode}, {self.most_common(3)}, unique={len(self)})"
@@ -0,0 +1,94 @@
+"""
+Проверка бюджета времени импорта для точек входа заданий.
+
+Каждая точка входа запускается в отдельном процессе с `python -X importtime`
+(CLI — с --help, модули — простым импортом). Проверяется, что:
+- не импортируются тяжелые библиотеки (torch, transformers, pandas и др.) — они должны
+  загружаться только при первом использовании;
+- суммарное время импорта сверх пустого интерпретатора укладывается в бюджет.
+
+Скрипт возвращает ненулевой код при нарушении, поэтому подходит для CI:
+    python check_import_time.py --budget-ms 150
+Та же проверка с бюджетом по умолчанию входит в тесты (tests/test_import_time.py).
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_BUDGET_MS = 150.0
+
+HEAVY_MODULES = {"torch", "transformers", "pandas", "numpy", "pyarrow", "tokenizers", "safetensors"}
+
+# (имя, аргументы интерпретатора)
+ENTRY_POINTS = [
+    ("review_integrator.py --help", [os.path.join(HERE, "review_integrator.py"), "--help"]),
+    ("summarizer.py --help", [os.path.join(HERE, "GenAI-1-04", "summarizer.py"), "--help"]),
+    ("import recognize_entities",
+     ["-c", f"import sys; sys.path.insert(0, {os.path.join(HERE, 'GenAI-1-20')!r}); import recognize_entities"]),
+    ("import task",
+     ["-c", "import sys; sys.path.insert(0, "
+            f"{os.path.join(HERE, 'GenAI-1-06', 'code', 'Block1', 'GenAI-1-06')!r}); import task"]),
+]
+
+
+def measure(args: list) -> tuple:
+    """
+    Запускает интерпретатор с -X importtime.
+    Возвращает (суммарное время импорта верхнего уровня в мс, множество импортированных модулей).
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True,
+                          cwd=HERE, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"))
+    if proc.returncode != 0:
+        raise RuntimeError(f"Команда завершилась с кодом {proc.returncode}:\n{proc.stderr[-2000:]}")
+    total_us = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # строка заголовка
+        modules.add(name.strip())
+        # Модули верхнего уровня записываются без отступа; их cumulative включает вложенные импорты
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def check(budget_ms: float = DEFAULT_BUDGET_MS, repeat: int = 3) -> list:
+    """
+    Замеряет все точки входа. Возвращает строки (имя, время импорта сверх пустого
+    интерпретатора в мс, список импортированных тяжелых модулей, уложилась ли точка в бюджет).
+    Время — минимум из repeat замеров.
+    """
+    baseline = min(measure(["-c", "pass"])[0] for _ in range(repeat))
+    results = []
+    for name, entry_args in ENTRY_POINTS:
+        runs = [measure(entry_args) for _ in range(repeat)]
+        elapsed = min(total for total, _ in runs) - baseline
+        heavy = sorted(HEAVY_MODULES & set().union(*(modules for _, modules in runs)))
+        results.append((name, elapsed, heavy, elapsed <= budget_ms and not heavy))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка бюджета времени импорта точек входа")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Допустимое время импорта сверх пустого интерпретатора, мс")
+    parser.add_argument("--repeat", type=int, default=3, help="Число замеров (берется минимум)")
+    args = parser.parse_args()
+
+    results = check(args.budget_ms, args.repeat)
+    print(f"{'entry point':<30}{'import, ms':>12}{'budget, ms':>12}  heavy modules")
+    for name, elapsed, heavy, ok in results:
+        print(f"{name:<30}{elapsed:>12.1f}{args.budget_ms:>12.1f}  {', '.join(heavy) or '-'}"
+              f"{'' if ok else '  FAIL'}")
+    sys.exit(0 if all(ok for *_, ok in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
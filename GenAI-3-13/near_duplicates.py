@@ -0,0 +1,125 @@
+"""
+Поиск почти одинаковых отзывов (MinHash + LSH), чтобы не запускать модели на копиях.
+
+Отзыв представляется множеством символьных k-грамм нормализованного текста; MinHash-подпись
+оценивает коэффициент Жаккара между отзывами, а LSH (разбиение подписи на полосы) находит
+кандидатов без сравнения всех пар. Кластеры строятся жадно: отзыв присоединяется к первому
+похожему представителю (оценка сходства не ниже threshold) или сам становится представителем.
+Поэтому каждый отзыв кластера похож именно на представителя, а не только на соседа по цепочке.
+Индекс LSH строится заново при каждом вызове cluster: тексты из разных вызовов (например,
+из разных порций CSV) между собой не сравниваются.
+
+Пример:
+    index = NearDuplicateIndex(threshold=0.85)
+    representatives = index.cluster(texts)  # позиция представителя для каждого текста
+"""
+
+import zlib
+
+from analysis_store import normalize_text
+
+# Простое число Мерсенна 2^61 - 1 для универсального хеширования (a * x + b) mod p
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class NearDuplicateIndex:
+    """
+    Кластеризация почти одинаковых текстов.
+
+    Параметры:
+        threshold (float): Минимальная оценка сходства по Жаккару для объединения в кластер.
+        num_perm (int): Длина MinHash-подписи (степень двойки).
+        shingle_size (int): Длина символьных k-грамм.
+        seed (int): Зерно хеш-функций; при одинаковом зерне результаты воспроизводимы.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold должен быть в интервале (0, 1]")
+        if num_perm < 1 or num_perm & (num_perm - 1):
+            raise ValueError("num_perm должен быть степенью двойки")
+        import numpy as np
+        self._np = np
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # a, b < 2^31, хеши k-грамм < 2^32: a * x + b помещается в uint64
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self.rows = self._choose_rows(threshold, num_perm)
+        self.bands = num_perm // self.rows
+        self.texts = 0
+        self.clusters = 0
+
+    @staticmethod
+    def _choose_rows(threshold: float, num_perm: int) -> int:
+        """
+        Число строк в полосе LSH. Порог срабатывания LSH примерно (1/bands)^(1/rows); он берется
+        с запасом ниже threshold, чтобы не терять похожие пары, а ложных кандидатов отсекает
+        проверка по подписи.
+        """
+        rows = 1
+        while rows * 2 <= num_perm and (rows * 2 / num_perm) ** (1 / (rows * 2)) <= threshold - 0.1:
+            rows *= 2
+        return rows
+
+    def signature(self, text: str):
+        """MinHash-подпись текста: массив uint64 длины num_perm."""
+        np = self._np
+        text = normalize_text(text).lower()
+        k = self.shingle_size
+        shingles = {text} if len(text) <= k else {text[i:i + k] for i in range(len(text) - k + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        return ((np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH).min(axis=0)
+
+    def similarity(self, first, second) -> float:
+        """Оценка коэффициента Жаккара по двум подписям."""
+        return float((first == second).mean())
+
+    def cluster(self, texts: list) -> list:
+        """
+        Группирует почти одинаковые тексты. Возвращает для каждого текста позицию его
+        представителя в texts (первого текста кластера); у представителя — собственная позиция.
+        Сравниваются только тексты этого вызова.
+        """
+        representatives = []
+        exact = {}
+        signatures = {}
+        buckets = [{} for _ in range(self.bands)]
+        for position, text in enumerate(texts):
+            # Точные копии (после нормализации) находятся без подписи
+            key = normalize_text(text).lower()
+            if key in exact:
+                representatives.append(exact[key])
+                continue
+            signature = self.signature(text)
+            bands = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+            best, best_similarity = position, self.threshold
+            seen = set()
+            for band, bucket in zip(bands, buckets):
+                for candidate in bucket.get(band, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    similarity = self.similarity(signature, signatures[candidate])
+                    if similarity >= best_similarity:
+                        best, best_similarity = candidate, similarity
+            if best == position:
+                # Новый кластер: в индекс LSH попадают только представители
+                signatures[position] = signature
+                for band, bucket in zip(bands, buckets):
+                    bucket.setdefault(band, []).append(position)
+            exact[key] = best
+            representatives.append(best)
+        self.texts += len(texts)
+        self.clusters += len(signatures)
+        return representatives
+
+    def stats(self) -> dict:
+        """Счетчики по всем вызовам cluster: тексты, кластеры, дубликаты и доля дубликатов."""
+        duplicates = self.texts - self.clusters
+        return {"texts": self.texts, "clusters": self.clusters, "duplicates": duplicates,
+                "hit_rate": round(duplicates / self.texts, 4) if self.texts else 0.0}
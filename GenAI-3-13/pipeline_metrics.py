@@ -0,0 +1,222 @@
+"""
+Инструментирование конвейера анализа отзывов: время, пропускная способность и память по этапам.
+
+Этапы оборачиваются в контекстный менеджер metrics.stage(...), загрузка моделей — в
+metrics.model_load(...). Итог сохраняется в JSON (save) для отслеживания регрессий.
+Метрики рабочих процессов передаются в основной процесс через to_dict/merge.
+
+Пример:
+    with metrics.stage("ner", items=len(texts), batch_size=16):
+        entities = recognize_entities_batch(ner, texts, batch_size=16)
+
+    # Число элементов можно указать и после выполнения этапа
+    with metrics.stage("read_csv") as record:
+        chunk = next(chunks)
+        record.items = len(chunk)
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+
+def peak_rss_mb():
+    """Пиковый RSS текущего процесса в мегабайтах (None, если модуль resource недоступен)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux — в килобайтах
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def current_rss_mb():
+    """Текущий RSS процесса в мегабайтах (None, если /proc недоступен, например в macOS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+
+
+def _delta(end, start):
+    """Разность с учетом None."""
+    return None if end is None or start is None else round(end - start, 1)
+
+
+def _max(a, b):
+    """Максимум с учетом None."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+# Поля памяти этапа; при объединении метрик процессов берется максимум
+_MEMORY_FIELDS = ("rss_start_mb", "rss_end_mb", "rss_delta_mb", "peak_rss_growth_mb", "process_peak_rss_mb")
+
+
+class PipelineMetrics:
+    """Накопитель метрик по этапам конвейера и времени загрузки моделей."""
+
+    def __init__(self):
+        self.stages = {}
+        self.model_loads = {}
+        # Произвольные счетчики (например, найденные дубликаты отзывов)
+        self.counters = {}
+        self._started = time.perf_counter()
+
+    def reset(self):
+        """Сбрасывает накопленные метрики."""
+        self.__init__()
+
+    def _stage_entry(self, name: str) -> dict:
+        return self.stages.setdefault(name, {
+            "calls": 0, "wall_time": 0.0, "items": 0, "batch_sizes": [],
+            "rss_start_mb": None, "rss_end_mb": None, "rss_delta_mb": None,
+            "peak_rss_growth_mb": None, "process_peak_rss_mb": None,
+        })
+
+    @contextmanager
+    def stage(self, name: str, items: int = None, batch_size: int = None):
+        """
+        Замеряет один вызов этапа. Возвращает запись с полями items и batch_size,
+        которые можно заполнить внутри блока.
+
+        Память этапа (максимум по вызовам, МБ): rss_start_mb и rss_end_mb — текущий RSS
+        в начале и в конце вызова, rss_delta_mb — их разность, peak_rss_growth_mb — на сколько
+        вырос пиковый RSS процесса (ru_maxrss) за вызов: больше нуля, только если этап поднял
+        пик выше всех предыдущих. process_peak_rss_mb — пиковый RSS процесса за все время
+        к концу этапа, а не пик самого этапа. RSS общий для процесса, поэтому в него входят
+        и этапы, идущие параллельно в других потоках.
+
+        Параметры:
+            name (str): Имя этапа (например, 'sentiment', 'ner', 'summarization').
+            items (int): Сколько элементов обработано за вызов (для items/sec).
+            batch_size (int): Размер пакета, с которым работал этап.
+        """
+        record = SimpleNamespace(items=items, batch_size=batch_size)
+        rss_start, peak_start = current_rss_mb(), peak_rss_mb()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            entry = self._stage_entry(name)
+            entry["calls"] += 1
+            entry["wall_time"] += time.perf_counter() - started
+            entry["items"] += record.items or 0
+            if record.batch_size is not None and record.batch_size not in entry["batch_sizes"]:
+                entry["batch_sizes"].append(record.batch_size)
+            rss_end, peak_end = current_rss_mb(), peak_rss_mb()
+            entry["rss_start_mb"] = _max(entry["rss_start_mb"], rss_start)
+            entry["rss_end_mb"] = _max(entry["rss_end_mb"], rss_end)
+            entry["rss_delta_mb"] = _max(entry["rss_delta_mb"], _delta(rss_end, rss_start))
+            entry["peak_rss_growth_mb"] = _max(entry["peak_rss_growth_mb"], _delta(peak_end, peak_start))
+            entry["process_peak_rss_mb"] = _max(entry["process_peak_rss_mb"], peak_end)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Увеличивает счетчик name на value."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def model_load(self, name: str):
+        """Замеряет загрузку модели; повторные загрузки (например, в разных процессах) суммируются."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.model_loads.setdefault(name, {"count": 0, "wall_time": 0.0})
+            entry["count"] += 1
+            entry["wall_time"] += time.perf_counter() - started
+
+    def merge(self, other: dict) -> None:
+        """Добавляет метрики, полученные через to_dict (например, из рабочего процесса)."""
+        for name, stats in other.get("stages", {}).items():
+            entry = self._stage_entry(name)
+            entry["calls"] += stats["calls"]
+            entry["wall_time"] += stats["wall_time"]
+            entry["items"] += stats["items"]
+            entry["batch_sizes"].extend(b for b in stats["batch_sizes"] if b not in entry["batch_sizes"])
+            for key in _MEMORY_FIELDS:
+                entry[key] = _max(entry[key], stats[key])
+        for name, stats in other.get("model_loads", {}).items():
+            entry = self.model_loads.setdefault(name, {"count": 0, "wall_time": 0.0})
+            entry["count"] += stats["count"]
+            entry["wall_time"] += stats["wall_time"]
+        for name, value in other.get("counters", {}).items():
+            self.count(name, value)
+
+    def to_dict(self) -> dict:
+        """
+        Возвращает метрики: по этапам — calls, wall_time (сек), items, items_per_sec, batch_sizes
+        и поля памяти (см. stage); по моделям — count и wall_time загрузки; счетчики; общее время и пиковый RSS процесса.
+        Время этапов рабочих процессов суммируется, поэтому может превышать total_wall_time.
+        """
+        stages = {}
+        for name, entry in self.stages.items():
+            wall_time = entry["wall_time"]
+            stages[name] = dict(
+                entry,
+                wall_time=round(wall_time, 4),
+                items_per_sec=round(entry["items"] / wall_time, 2) if entry["items"] and wall_time > 0 else None,
+            )
+        return {
+            "total_wall_time": round(time.perf_counter() - self._started, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+            "model_loads": {name: dict(entry, wall_time=round(entry["wall_time"], 4))
+                            for name, entry in self.model_loads.items()},
+            "counters": dict(self.counters),
+        }
+
+    def save(self, path: str) -> None:
+        """Сохраняет метрики в JSON-файл."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+# Метрики текущего процесса
+metrics = PipelineMetrics()
+
+
+@contextmanager
+def profiled(path: str = None, profiler: str = "cprofile"):
+    """
+    Профилирует блок кода и сохраняет результат в path; без path ничего не делает.
+
+    profiler='cprofile' пишет дамп pstats (смотреть через python -m pstats или snakeviz),
+    profiler='pyinstrument' — HTML-отчет (требуется пакет pyinstrument).
+    """
+    if not path:
+        yield
+        return
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("Для --profiler pyinstrument требуется пакет pyinstrument: pip install pyinstrument")
+        profiler_instance = Profiler()
+        profiler_instance.start()
+        try:
+            yield
+        finally:
+            profiler_instance.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler_instance.output_html())
+        return
+    if profiler != "cprofile":
+        raise ValueError(f"Неизвестный профайлер: {profiler!r}")
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,164 @@
+"""
+Потоковая запись отчета по продуктам: текстовый отчет и машиночитаемый JSONL/Parquet.
+
+Раздел каждого продукта записывается на диск сразу после подготовки, поэтому отчет
+не собирается целиком в памяти. Запись идет во временные файлы <путь>.tmp, которые
+заменяют итоговые только при успешном завершении: ошибка анализа не портит прежний отчет. Структурированный отчет содержит для каждого продукта
+аспекты, число отзывов и сводку; формат выбирается по расширению (.jsonl или .parquet).
+
+Пример:
+    with ReportWriter("analysis_report.txt", "analysis_report.jsonl") as writer:
+        writer.write_product(record, aspect_lines)
+"""
+
+import json
+import os
+
+REPORT_TITLE = "--- Сводный отчет по анализу отзывов ---"
+SECTION_SEPARATOR = "-" * 50
+
+# Число записей в одной группе строк Parquet
+_PARQUET_ROW_GROUP = 1000
+
+
+def format_section(product: str, aspect_lines: list, summary: str) -> str:
+    """Текст раздела отчета для одного продукта."""
+    lines = [f"Продукт: {product}"]
+    if aspect_lines:
+        lines.append("Ключевые аспекты:")
+        lines.extend(f"  - {aspect}" for aspect in aspect_lines)
+    lines.append(f"Краткая сводка: {summary}")
+    lines.append(SECTION_SEPARATOR)
+    return "\n".join(lines) + "\n\n"
+
+
+class _JsonlSink:
+    """Запись структурированного отчета построчно в JSONL."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetSink:
+    """Запись структурированного отчета в Parquet группами строк (требуется pyarrow)."""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Для отчета в формате Parquet требуется пакет pyarrow: pip install pyarrow")
+        self._pa = pa
+        self._schema = pa.schema([
+            ("product_id", pa.string()),
+            ("positive_reviews", pa.int64()),
+            ("negative_reviews", pa.int64()),
+            ("positive_aspects", pa.list_(pa.struct([("aspect", pa.string()), ("count", pa.int64())]))),
+            ("negative_aspects", pa.list_(pa.struct([("aspect", pa.string()), ("count", pa.int64())]))),
+            ("summary", pa.string()),
+            ("summary_source", pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._buffer = []
+
+    def write(self, record: dict) -> None:
+        self._buffer.append(record)
+        if len(self._buffer) >= _PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._writer.write_table(self._pa.Table.from_pylist(self._buffer, schema=self._schema))
+            self._buffer = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+class ReportWriter:
+    """
+    Потоковый писатель отчета.
+
+    Параметры:
+        text_path (str): Путь к текстовому отчету (None — не писать).
+        structured_path (str): Путь к отчету .jsonl или .parquet (None — не писать).
+        text_stream: Открытый текстовый поток вместо text_path (например, io.StringIO).
+
+    Файлы отчетов появляются под итоговыми именами только после close(commit=True);
+    при выходе из блока with по исключению временные файлы удаляются.
+    """
+
+    def __init__(self, text_path: str = None, structured_path: str = None, text_stream=None):
+        self.text_path = text_path
+        self.structured_path = structured_path
+        self.products = 0
+        self._owns_text = text_stream is None and text_path is not None
+        # Пары (временный файл, итоговый файл), переименовываемые при успешном завершении
+        self._pending = []
+        self._text = text_stream
+        self._structured = None
+        if structured_path:
+            extension = os.path.splitext(structured_path)[1].lower()
+            if extension not in (".jsonl", ".parquet"):
+                raise ValueError(f"Неизвестный формат структурированного отчета: {structured_path!r} "
+                                 f"(ожидается .jsonl или .parquet)")
+        if self._owns_text:
+            self._text = open(self._temporary(text_path), "w", encoding="utf-8")
+        if structured_path:
+            sink = _JsonlSink if extension == ".jsonl" else _ParquetSink
+            try:
+                self._structured = sink(self._temporary(structured_path))
+            except Exception:
+                self.close(commit=False)
+                raise
+        if self._text is not None:
+            self._text.write(REPORT_TITLE + "\n\n")
+
+    def write_product(self, record: dict, aspect_lines: list) -> None:
+        """
+        Записывает раздел продукта в оба отчета.
+
+        record: product_id, positive_reviews, negative_reviews, positive_aspects, negative_aspects
+        (списки {'aspect', 'count'} по убыванию частоты), summary, summary_source
+        ('model', 'aspects' или 'none').
+        aspect_lines: строки «Ключевые аспекты» для текстового отчета.
+        """
+        if self._text is not None:
+            self._text.write(format_section(record["product_id"], aspect_lines, record["summary"]))
+        if self._structured is not None:
+            self._structured.write(record)
+        self.products += 1
+
+    def _temporary(self, path: str) -> str:
+        temporary = path + ".tmp"
+        self._pending.append((temporary, path))
+        return temporary
+
+    def close(self, commit: bool = True) -> None:
+        """
+        Закрывает файлы отчетов. При commit=True временные файлы заменяют итоговые,
+        иначе удаляются, и прежние отчеты остаются нетронутыми.
+        """
+        if self._owns_text:
+            self._text.close()
+        if self._structured is not None:
+            self._structured.close()
+        for temporary, path in self._pending:
+            if commit:
+                os.replace(temporary, path)
+            elif os.path.exists(temporary):
+                os.remove(temporary)
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
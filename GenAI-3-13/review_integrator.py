@@ -15,11 +15,33 @@
 6. Сохраняет итоговый отчет в файл.
 """
 
-import pandas as pd
-from transformers import pipeline, Pipeline
-from collections import defaultdict
+from __future__ import annotations
+
+import argparse
+import csv
+import importlib.util
+import io
+import math
+import multiprocessing
 import sys
 import os
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING
+
+from analysis_store import AnalysisStore, model_versions
+from aspect_counter import AspectCounter
+from near_duplicates import NearDuplicateIndex
+from pipeline_metrics import metrics, profiled
+from report_writer import ReportWriter
+
+# pandas, transformers и torch импортируются при первом использовании: --help и ошибки
+# во входных данных не должны ждать загрузки тяжелых библиотек
+if TYPE_CHECKING:
+    import pandas as pd
 
 # --- Блок 1: Настоящая интеграция через импорт ---
 
@@ -32,9 +54,9 @@ try:
     sys.path.append(os.path.join(current_dir, 'GenAI-1-06', 'code', 'Block1', 'GenAI-1-06'))
 
     # Импортируем функции напрямую из файлов заданий
-    from summarizer import summarize_text
-    from recognize_entities import recognize_entities
-    from task import analyze_sentiment_from_texts
+    from summarizer import DECODING_TIERS, DISTILLED_MODEL, DecodingPolicy, summarize_long_texts
+    from recognize_entities import recognize_entities_batch
+    from task import SENTIMENT_MODEL, Labels, analyze_sentiment_from_texts, load_sentiment_model
 
     print("Все функции из модулей GenAI-1-04, GenAI-1-06 и GenAI-1-20 успешно импортированы.")
 
@@ -45,17 +67,174 @@ except ImportError as e:
     sys.exit(1)
 
 
-def load_models() -> dict:
+MODEL_IDS = {
+    'sentiment': SENTIMENT_MODEL,
+    'ner': 'dslim/bert-base-NER',
+    'summarizer': 'facebook/bart-large-cnn',
+    # Загружается только для --summary-tier fast и --summary-budget-ms
+    'summarizer_fast': DISTILLED_MODEL,
+}
+MODEL_NAMES = ('sentiment', 'ner', 'summarizer')
+# Модели, нужные для анализа отзывов (без суммаризации)
+ANALYSIS_MODELS = ('sentiment', 'ner')
+
+
+def resolve_model_path(model_id: str, models_dir: str = None) -> str:
+    """
+    Возвращает путь к локальной копии модели в models_dir (models_dir/<org>/<name> или
+    models_dir/<name>), а если ее нет — имя модели в Hub.
+    """
+    if models_dir:
+        for candidate in (os.path.join(models_dir, model_id), os.path.join(models_dir, model_id.split('/')[-1])):
+            if os.path.isfile(os.path.join(candidate, 'config.json')):
+                return candidate
+        print(f"Предупреждение: локальная копия {model_id} не найдена в '{models_dir}', используется Hub.",
+              file=sys.stderr)
+    return model_id
+
+
+def _pipeline_kwargs() -> dict:
+    """
+    Параметры экономной загрузки: веса сразу загружаются в итоговые тензоры, без промежуточной
+    копии в памяти. В старых версиях transformers low_cpu_mem_usage требует accelerate,
+    в новых такая загрузка (с mmap для safetensors) выполняется всегда.
+    """
+    if importlib.util.find_spec('accelerate') is None:
+        return {}
+    return {'model_kwargs': {'low_cpu_mem_usage': True}}
+
+
+# Инициализация моделей в transformers не потокобезопасна (общий контекст meta-устройства),
+# поэтому сборка моделей сериализуется, а параллельно идут скачивание и чтение файлов весов
+_MODEL_INIT_LOCK = threading.Lock()
+_WEIGHT_SUFFIXES = ('.safetensors', '.bin')
+
+
+# Файлы, нужные pipeline из репозитория модели в Hub (без весов других фреймворков)
+_SNAPSHOT_PATTERNS = ['*.json', '*.txt', '*.model', '*.safetensors']
+
+
+def _download_snapshot(model_id: str) -> str:
+    """
+    Скачивает модель из Hub в локальный кэш (или берет уже скачанную) и возвращает путь
+    к снимку; если это не удалось (например, нет сети), возвращает model_id — ошибку
+    тогда покажет сборка pipeline. Веса .bin скачиваются, только если нет safetensors.
+    """
+    try:
+        from huggingface_hub import snapshot_download
+
+        path = snapshot_download(model_id, allow_patterns=_SNAPSHOT_PATTERNS)
+        if not any(name.endswith('.safetensors') for name in os.listdir(path)):
+            path = snapshot_download(model_id, allow_patterns=_SNAPSHOT_PATTERNS + ['pytorch_model*.bin'])
+        return path
+    except Exception:
+        return model_id
+
+
+def _prefetch_weights(path: str) -> None:
+    """
+    Читает файлы весов локальной копии модели, чтобы они оказались в page cache:
+    последующая загрузка (mmap для safetensors) не будет ждать диск.
+    """
+    if not os.path.isdir(path):
+        return
+    for file_name in os.listdir(path):
+        if file_name.endswith(_WEIGHT_SUFFIXES):
+            with open(os.path.join(path, file_name), 'rb') as f:
+                while f.read(16 * 1024 * 1024):
+                    pass
+
+
+def _build_pipeline(name: str, model: str):
+    """Создает pipeline для модели name из локального пути или Hub."""
+    from transformers import pipeline
+
+    if name == 'sentiment':
+        return load_sentiment_model(model, **_pipeline_kwargs())
+    if name == 'ner':
+        return pipeline('ner', model=model, aggregation_strategy='simple', **_pipeline_kwargs())
+    return pipeline('summarization', model=model, **_pipeline_kwargs())
+
+
+class BackgroundModels(Mapping):
+    """
+    Модели, загружаемые в фоновых потоках параллельно чтению отзывов.
+    Скачивание из Hub и чтение файлов весов идут параллельно, сборка моделей идет по очереди (см. _MODEL_INIT_LOCK).
+    Обращение models[name] ждет загрузки только этой модели; ошибка загрузки
+    пробрасывается при обращении. Исключение — модель тональности: если она не загрузилась,
+    models['sentiment'] равно None, и отзывы считаются нейтральными (см. _infer).
+    """
+
+    def __init__(self, names=MODEL_NAMES, models_dir: str = None):
+        self.started = time.perf_counter()
+        # Для каждой модели: начало и готовность относительно started и время собственно
+        # загрузки (чтение весов и сборка, без ожидания очереди)
+        self.load_spans = {}
+        self._futures = {}
+        for name in names:
+            future = self._futures[name] = Future()
+            # Потоки-демоны: при досрочном завершении (пустой CSV, ошибка) интерпретатор
+            # не ждет окончания скачивания и загрузки моделей, которые уже не нужны
+            threading.Thread(target=self._run, args=(future, name, models_dir),
+                             name=f'model-load-{name}', daemon=True).start()
+
+    def _run(self, future: Future, name: str, models_dir: str):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._load(name, models_dir))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _load(self, name: str, models_dir: str):
+        started = time.perf_counter()
+        path = resolve_model_path(MODEL_IDS[name], models_dir)
+        # Скачивание из Hub и чтение весов идут вне блокировки, параллельно для всех моделей;
+        # pipeline собирается по исходному имени (файлы уже в кэше), чтобы версии моделей
+        # в ключах AnalysisStore не зависели от пути к снимку
+        local_path = path if os.path.isdir(path) else _download_snapshot(path)
+        _prefetch_weights(local_path)
+        busy = time.perf_counter() - started
+        with _MODEL_INIT_LOCK:
+            build_started = time.perf_counter()
+            with metrics.model_load(name):
+                try:
+                    model = _build_pipeline(name, path)
+                except Exception as e:
+                    if name != 'sentiment':
+                        raise
+                    # Без модели тональности анализ продолжается: все отзывы считаются нейтральными
+                    print(f"Ошибка при загрузке модели sentiment-analysis: {e}. "
+                          f"Все отзывы будут считаться нейтральными.", file=sys.stderr)
+                    model = None
+            busy += time.perf_counter() - build_started
+        self.load_spans[name] = (started - self.started, time.perf_counter() - self.started, busy)
+        return model
+
+    def __getitem__(self, name: str):
+        return self._futures[name].result()
+
+    def __iter__(self):
+        return iter(self._futures)
+
+    def __len__(self):
+        return len(self._futures)
+
+    def wait(self) -> dict:
+        """Дожидается загрузки всех моделей и возвращает обычный словарь."""
+        return {name: self[name] for name in self}
+
+
+def load_models(names=MODEL_NAMES, models_dir: str = None) -> dict:
     """
-    Загружает и инициализирует модели для NER и Суммаризации.
-    Модель для анализа тональности загружается внутри своей импортированной функции.
+    Загружает и инициализирует модели для анализа тональности, NER и Суммаризации.
+    Модели загружаются в фоне, один раз, и переиспользуются для всех порций отзывов.
+    names позволяет загрузить только часть моделей (например, в рабочих процессах),
+    models_dir — каталог с локальными копиями моделей.
     """
-    print("Загрузка моделей для NER и Суммаризации...")
+    print(f"Загрузка моделей: {', '.join(names)}...")
     try:
-        models = {
-            'ner': pipeline('ner', model='dslim/bert-base-NER', aggregation_strategy='simple'),
-            'summarizer': pipeline('summarization', model='facebook/bart-large-cnn')
-        }
+        models = BackgroundModels(names, models_dir).wait()
         print("Модели успешно загружены.")
         return models
     except Exception as e:
@@ -63,15 +242,73 @@ def load_models() -> dict:
         sys.exit(1)
 
 
+def print_startup_breakdown(models: BackgroundModels) -> None:
+    """Печатает, сколько заняла загрузка каждой модели и чтение отзывов при старте."""
+    spans = models.load_spans
+    if not spans:
+        return
+    print("\nЗапуск (секунды от начала загрузки моделей):")
+    for name, (started, finished, busy) in spans.items():
+        print(f"  {name:<15} {started:7.2f} -> {finished:7.2f}  (загрузка {busy:.2f} с)")
+    read_csv = metrics.stages.get('read_csv')
+    if read_csv:
+        print(f"  {'read_csv':<15} {read_csv['wall_time']:7.2f} с суммарно (параллельно с загрузкой)")
+    ready = max(finished for _, finished, _ in spans.values())
+    sequential = sum(busy for _, _, busy in spans.values())
+    print(f"  Все модели готовы через {ready:.2f} с (последовательно: {sequential:.2f} с)")
+
+
+REQUIRED_COLUMNS = ['product_id', 'review_text']
+
+
+def _clean_reviews(df: pd.DataFrame) -> pd.DataFrame:
+    """Очищает порцию отзывов от лишних пробелов и пустых значений."""
+    # Очищаем данные от лишних пробелов
+    df['product_id'] = df['product_id'].str.strip()
+    df['review_text'] = df['review_text'].str.strip()
+    
+    # Проверяем, что нет пустых значений
+    if df[REQUIRED_COLUMNS].isnull().any().any():
+        print(f"Предупреждение: Обнаружены пустые значения в данных.", file=sys.stderr)
+        df = df.dropna(subset=REQUIRED_COLUMNS)
+    
+    return df
+
+
+def _missing_columns(columns) -> list:
+    return [col for col in REQUIRED_COLUMNS if col not in columns]
+
+
+def check_reviews_file(file_path: str):
+    """
+    Быстрая проверка файла с отзывами до загрузки моделей: файл существует и в заголовке
+    есть нужные колонки. Возвращает текст ошибки или None.
+    """
+    if not os.path.isfile(file_path):
+        return f"Файл с отзывами '{file_path}' не найден."
+    try:
+        with open(file_path, newline='', encoding='utf-8') as f:
+            header = next(csv.reader(f, skipinitialspace=True), [])
+    except Exception as e:
+        return f"Ошибка при чтении CSV-файла: {e}"
+    missing_columns = _missing_columns([col.strip() for col in header])
+    if missing_columns:
+        return f"В CSV отсутствуют колонки: {missing_columns}"
+    return None
+
+
 def load_reviews(file_path: str):
     """Загружает отзывы из CSV-файла с валидацией."""
+    import pandas as pd
+
     try:
         # Читаем CSV с правильными параметрами для обработки пробелов
-        df = pd.read_csv(file_path, skipinitialspace=True)
+        with metrics.stage('read_csv') as record:
+            df = pd.read_csv(file_path, skipinitialspace=True)
+            record.items = len(df)
         
         # Валидация: проверяем наличие нужных колонок
-        required_columns = ['product_id', 'review_text']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = _missing_columns(df.columns)
         if missing_columns:
             print(f"Ошибка: В CSV отсутствуют колонки: {missing_columns}", file=sys.stderr)
             return None
@@ -81,16 +318,7 @@ def load_reviews(file_path: str):
             print(f"Ошибка: CSV-файл '{file_path}' пустой.", file=sys.stderr)
             return None
         
-        # Очищаем данные от лишних пробелов
-        df['product_id'] = df['product_id'].str.strip()
-        df['review_text'] = df['review_text'].str.strip()
-        
-        # Проверяем, что нет пустых значений
-        if df[required_columns].isnull().any().any():
-            print(f"Предупреждение: Обнаружены пустые значения в данных.", file=sys.stderr)
-            df = df.dropna(subset=required_columns)
-        
-        return df
+        return _clean_reviews(df)
         
     except FileNotFoundError:
         print(f"Ошибка: Файл с отзывами '{file_path}' не найден.", file=sys.stderr)
@@ -100,132 +328,702 @@ def load_reviews(file_path: str):
         return None
 
 
-def generate_report(reviews_df: pd.DataFrame, models: dict) -> str:
+def _pandas_chunks(file_path: str, chunk_size: int):
+    """Читает CSV порциями через pandas."""
+    import pandas as pd
+
+    reader = pd.read_csv(file_path, skipinitialspace=True, chunksize=chunk_size,
+                         usecols=lambda col: col.strip() in REQUIRED_COLUMNS)
+    with reader:
+        yield from reader
+
+
+def _pyarrow_chunks(file_path: str, chunk_size: int):
+    """Читает CSV потоково через pyarrow и нарезает на порции по chunk_size строк."""
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        raise ImportError("Для engine='pyarrow' требуется пакет pyarrow: pip install pyarrow")
+
+    # include_columns сравнивает имена точно, поэтому берем их из заголовка как есть
+    # (например, ' review_text' после запятой с пробелом); имена очищаются в iter_review_chunks
+    with open(file_path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f), [])
+    columns = [col for col in header if col.strip() in REQUIRED_COLUMNS]
+    reader = pa_csv.open_csv(file_path, convert_options=pa_csv.ConvertOptions(
+        include_columns=columns, column_types={col: pa.string() for col in columns}))
+    pending, pending_rows = [], 0
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunk_size:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, chunk_size).to_pandas()
+            rest = table.slice(chunk_size)
+            pending, pending_rows = rest.to_batches(), rest.num_rows
+    if pending_rows:
+        yield pa.Table.from_batches(pending).to_pandas()
+
+
+def iter_review_chunks(file_path: str, chunk_size: int = 10000, engine: str = 'pandas'):
     """
-    Генерирует полный отчет на основе анализа отзывов, вызывая импортированные функции.
+    Читает отзывы из CSV порциями по chunk_size строк, не загружая файл целиком.
+    Каждая порция проходит ту же очистку, что и в load_reviews; индекс порции — сквозной
+    номер строки в файле, чтобы агрегаты разных порций сохраняли исходный порядок.
+
+    Параметры:
+        file_path (str): Путь к CSV-файлу.
+        chunk_size (int): Число строк в порции.
+        engine (str): 'pandas' или 'pyarrow'.
     """
-    product_aspects = defaultdict(lambda: defaultdict(list))
-    all_texts = reviews_df['review_text'].tolist()
+    if chunk_size < 1:
+        raise ValueError("chunk_size должен быть положительным")
+    if engine not in ('pandas', 'pyarrow'):
+        raise ValueError(f"Неизвестный engine: {engine!r}")
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Файл с отзывами '{file_path}' не найден.")
+
+    import pandas as pd
 
+    chunks = _pandas_chunks(file_path, chunk_size) if engine == 'pandas' else _pyarrow_chunks(file_path, chunk_size)
+    offset = 0
+    while True:
+        with metrics.stage('read_csv', batch_size=chunk_size) as record:
+            chunk = next(chunks, None)
+            record.items = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+        chunk.columns = [col.strip() for col in chunk.columns]
+        missing_columns = _missing_columns(chunk.columns)
+        if missing_columns:
+            raise ValueError(f"В CSV отсутствуют колонки: {missing_columns}")
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield _clean_reviews(chunk)
+
+
+# Сущности этих типов не считаются аспектами продукта
+NON_ASPECT_ENTITY_GROUPS = ['PER', 'LOC', 'DATE', 'MISC']
+# Сколько отзывов каждой тональности берется в текст для суммаризации
+SUMMARY_SAMPLES_PER_SENTIMENT = 2
+REPORT_SENTIMENTS = [Labels.POSITIVE.value, Labels.NEGATIVE.value]
+
+
+def _infer(texts: list, models: dict, ner_batch_size: int) -> tuple:
+    """Запускает модели тональности и NER; возвращает списки sentiment, confidence и aspects."""
     # Шаг 1: Анализ тональности для всех отзывов одним пакетом (вызов функции из GenAI-1-06)
     print("Выполнение анализа тональности (используется модуль GenAI-1-06)...")
-    sentiment_results = analyze_sentiment_from_texts(all_texts)
-    text_to_sentiment = {res['text']: res['label'] for res in sentiment_results}
+    classifier = models.get('sentiment')
+    sentiment_results = []
+    if classifier is not None:
+        with metrics.stage('sentiment', items=len(texts)):
+            sentiment_results = analyze_sentiment_from_texts(texts, classifier=classifier)
+    if len(sentiment_results) == len(texts):
+        sentiments = [res['label'] for res in sentiment_results]
+        confidences = [res['confidence'] for res in sentiment_results]
+    else:
+        # Модель тональности не загрузилась: все отзывы считаются нейтральными
+        sentiments = [Labels.NEUTRAL.value] * len(texts)
+        confidences = [float('nan')] * len(texts)
 
+    # Шаг 2: Извлечение аспектов для всех отзывов пакетами (вызов функции из GenAI-1-20)
     print("Выполнение извлечения аспектов (используется модуль GenAI-1-20)...")
-    for index, row in reviews_df.iterrows():
-        product = row['product_id']
-        review_text = row['review_text']
-        
-        sentiment = text_to_sentiment.get(review_text, 'NEUTRAL')
-        
-        # Шаг 2: Извлечение аспектов (вызов функции из GenAI-1-20)
-        all_entities = recognize_entities(models['ner'], review_text)
-        aspects = [
-            entity['word'] for entity in all_entities
-            if entity['entity_group'] not in ['PER', 'LOC', 'DATE', 'MISC']
-        ]
-        
-        if sentiment != 'NEUTRAL' and aspects:
-            product_aspects[product][sentiment].extend(aspects)
-    
+    with metrics.stage('ner', items=len(texts), batch_size=ner_batch_size):
+        entities_per_review = recognize_entities_batch(models['ner'], texts, batch_size=ner_batch_size)
+    aspects = [
+        [entity['word'] for entity in entities if entity['entity_group'] not in NON_ASPECT_ENTITY_GROUPS]
+        for entities in entities_per_review
+    ]
+    return sentiments, confidences, aspects
+
+
+def _infer_deduplicated(texts: list, models: dict, ner_batch_size: int, dedup: NearDuplicateIndex) -> tuple:
+    """
+    Запускает модели только для представителей кластеров почти одинаковых отзывов и копирует
+    их результаты остальным отзывам кластера. Без dedup анализирует все тексты.
+    """
+    if dedup is None:
+        return _infer(texts, models, ner_batch_size)
+
+    with metrics.stage('dedup', items=len(texts)):
+        representatives = dedup.cluster(texts)
+    unique = sorted(set(representatives))
+    metrics.count('dedup_reviews', len(texts))
+    metrics.count('dedup_duplicates', len(texts) - len(unique))
+    print(f"Почти одинаковых отзывов: {len(texts) - len(unique)}, к анализу: {len(unique)}")
+    sentiments, confidences, aspects = _infer([texts[i] for i in unique], models, ner_batch_size)
+
+    # Результаты представителей копируются всем отзывам их кластеров
+    slot = {position: i for i, position in enumerate(unique)}
+    members = [slot[representative] for representative in representatives]
+    return ([sentiments[i] for i in members], [confidences[i] for i in members],
+            [aspects[i] for i in members])
+
+
+def _infer_with_store(texts: list, models: dict, ner_batch_size: int, store: AnalysisStore,
+                      dedup: NearDuplicateIndex = None) -> tuple:
+    """
+    Берет готовые результаты из хранилища и запускает модели только для новых отзывов.
+    Почти одинаковые отзывы (dedup) ищутся уже среди новых, поэтому счетчики дубликатов
+    учитывают только вызовы моделей, которые действительно не понадобились.
+    """
+    versions = model_versions(models, ANALYSIS_MODELS)
+    versions['aspect_filter'] = NON_ASPECT_ENTITY_GROUPS
+    with metrics.stage('store_lookup', items=len(texts)):
+        keys = [store.make_key(text, versions) for text in texts]
+        known = store.get_many(keys)
+
+    # Одинаковые новые отзывы анализируются один раз
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in known:
+            missing.setdefault(key, text)
+    print(f"Из хранилища: {len(texts) - sum(key in missing for key in keys)}, к анализу: {len(missing)}")
+    if missing:
+        fresh = dict(zip(missing, zip(*_infer_deduplicated(list(missing.values()), models,
+                                                             ner_batch_size, dedup))))
+        # Запасной результат без модели тональности (confidence = NaN) не сохраняем
+        with metrics.stage('store_write', items=len(fresh)):
+            store.put_many({key: value for key, value in fresh.items() if not math.isnan(value[1])})
+        known.update(fresh)
+
+    sentiments, confidences, aspects = zip(*(known[key] for key in keys))
+    return list(sentiments), list(confidences), list(aspects)
+
+
+def analyze_reviews(reviews_df: pd.DataFrame, models: dict, ner_batch_size: int = 16,
+                    store: AnalysisStore = None, dedup: NearDuplicateIndex = None) -> pd.DataFrame:
+    """
+    Анализирует все отзывы за один проход и возвращает копию DataFrame с колонками
+    sentiment, confidence и aspects (список аспектов отзыва).
+    Результаты сопоставляются с отзывами по позиции, а не по тексту, поэтому
+    одинаковые отзывы не склеиваются. Индекс reviews_df сохраняется.
+    Модель тональности берется из models['sentiment'], если она загружена заранее.
+    Если передан store, модели запускаются только для отзывов, которых нет в хранилище,
+    а новые результаты сохраняются в него.
+    Если передан dedup, почти одинаковые отзывы группируются, модели запускаются только для
+    представителей кластеров, а их результаты копируются остальным отзывам кластера
+    (каждый отзыв по-прежнему учитывается в агрегатах). Вместе со store дубликаты ищутся
+    только среди отзывов, которых нет в хранилище. Кластеры строятся в пределах одного вызова,
+    поэтому при потоковой обработке копии из разных порций не объединяются.
+    """
+    analyzed = reviews_df.copy()
+    all_texts = analyzed['review_text'].tolist()
+    if not all_texts:
+        analyzed['sentiment'], analyzed['confidence'], analyzed['aspects'] = [], [], []
+        return analyzed
+
+    if store is None:
+        sentiments, confidences, aspects = _infer_deduplicated(all_texts, models, ner_batch_size, dedup)
+    else:
+        sentiments, confidences, aspects = _infer_with_store(all_texts, models, ner_batch_size, store, dedup)
+    analyzed['sentiment'] = sentiments
+    analyzed['confidence'] = confidences
+    analyzed['aspects'] = aspects
+    return analyzed
+
+
+def _per_product(grouped: pd.Series, products: pd.Index, empty=list) -> pd.DataFrame:
+    """
+    Разворачивает серию значений с индексом (product_id, sentiment) в таблицу продукт × тональность.
+    Отсутствующие ячейки заполняются новыми объектами empty().
+    """
+    table = grouped.unstack('sentiment').reindex(index=products, columns=REPORT_SENTIMENTS)
+    value_type = type(empty())
+    return table.apply(lambda column: column.map(lambda value: value if isinstance(value, value_type) else empty()))
+
+
+# Сколько уникальных аспектов на продукт и тональность считается точно; сверх этого —
+# приближенный подсчет Space-Saving (см. AspectCounter)
+MAX_UNIQUE_ASPECTS = 10000
+# Сколько самых частых аспектов выводится в текстовом и структурированном отчетах
+REPORT_TOP_ASPECTS = 5
+STRUCTURED_TOP_ASPECTS = 20
+
+AGGREGATE_COLUMNS = ['first_aspect_row'] + [
+    f"{sentiment}_{kind}" for kind in ('reviews', 'aspects', 'samples') for sentiment in REPORT_SENTIMENTS]
+
+
+def aggregate_by_product(analyzed_df: pd.DataFrame, max_unique_aspects: int = MAX_UNIQUE_ASPECTS) -> pd.DataFrame:
+    """
+    Группирует результаты analyze_reviews по продуктам и тональности.
+
+    Возвращает DataFrame с индексом product_id (в порядке первого появления) и колонками
+    first_aspect_row — индекс первого не нейтрального отзыва с аспектами (NaN, если таких нет),
+    positive_reviews / negative_reviews — число отзывов каждой тональности,
+    positive_aspects / negative_aspects — AspectCounter с частотами аспектов (мусорные токены NER
+    отбрасываются при добавлении, уникальных аспектов хранится не больше max_unique_aspects),
+    positive_samples / negative_samples — первые отзывы каждой тональности для суммаризации.
+    Агрегаты разных порций отзывов объединяются через merge_aggregates.
+    """
+    import pandas as pd
+
+    keys = ['product_id', 'sentiment']
+    opinionated = analyzed_df[analyzed_df['sentiment'] != Labels.NEUTRAL.value]
+    products = pd.Index(opinionated['product_id'].unique(), name='product_id')
+    if products.empty:
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS, index=products)
+
+    with_aspects = opinionated[opinionated['aspects'].str.len() > 0]
+    first_aspect_row = pd.Series(with_aspects.index, index=with_aspects['product_id']).groupby(level=0).min()
+
+    aspects = with_aspects[keys + ['aspects']].explode('aspects').rename(columns={'aspects': 'aspect'})
+    # Частые аспекты добавляются первыми: при переполнении счетчика вытесняются редкие
+    aspect_counts = aspects.groupby(keys + ['aspect'], sort=False).size().sort_values(ascending=False, kind='stable')
+    counters = {}
+    for (product, sentiment, aspect), count in aspect_counts.items():
+        counters.setdefault((product, sentiment), AspectCounter(max_unique_aspects)).add(aspect, count)
+    aspect_counters = pd.Series(list(counters.values()), dtype=object,
+                                index=pd.MultiIndex.from_tuples(list(counters), names=keys))
+
+    samples = opinionated.groupby(keys, sort=False).head(SUMMARY_SAMPLES_PER_SENTIMENT)
+    sample_lists = samples.groupby(keys, sort=False)['review_text'].agg(list)
+
+    counts = opinionated.groupby(keys, sort=False).size().unstack('sentiment')
+    counts = counts.reindex(index=products, columns=REPORT_SENTIMENTS).fillna(0).astype(int)
+
+    summary = pd.concat([counts.add_suffix('_reviews'),
+                         _per_product(aspect_counters, products, lambda: AspectCounter(max_unique_aspects))
+                         .add_suffix('_aspects'),
+                         _per_product(sample_lists, products).add_suffix('_samples')], axis=1)
+    summary.insert(0, 'first_aspect_row', first_aspect_row.reindex(products).astype(float))
+    return summary[AGGREGATE_COLUMNS]
+
+
+def merge_aggregates(*aggregates: pd.DataFrame, max_unique_aspects: int = MAX_UNIQUE_ASPECTS) -> pd.DataFrame:
+    """
+    Объединяет результаты aggregate_by_product для последовательных порций отзывов.
+    Результат совпадает с агрегатом, посчитанным по всем отзывам сразу.
+    """
+    import pandas as pd
+
+    non_empty = [agg for agg in aggregates if not agg.empty]
+    if not non_empty:
+        # Во всех порциях только нейтральные отзывы (pd.concat не принимает пустой список)
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS, index=pd.Index([], name='product_id'))
+    combined = pd.concat(non_empty)
+
+    def merge_counters(counters):
+        return AspectCounter.merged(counters, max_unique_aspects)
+
+    def first_samples(lists):
+        return [text for texts in lists for text in texts][:SUMMARY_SAMPLES_PER_SENTIMENT]
+
+    rules = {'first_aspect_row': 'min'}
+    for sentiment in REPORT_SENTIMENTS:
+        rules[f'{sentiment}_reviews'] = 'sum'
+        rules[f'{sentiment}_aspects'] = merge_counters
+        rules[f'{sentiment}_samples'] = first_samples
+    merged = combined.groupby(level=0, sort=False).agg(rules)
+    merged.index.name = 'product_id'
+    return merged[AGGREGATE_COLUMNS]
+
+
+def _summary_input(row) -> str:
+    """Собирает текст для суммаризации из реальных отзывов продукта (пустая строка, если их нет)."""
+    reviews_for_summary = row['positive_samples'] + row['negative_samples']
+    if not reviews_for_summary:
+        return ""
+    # Объединяем отзывы для суммаризации; длинный текст не обрезается —
+    # summarize_long_texts разбивает его по границам токенов (map-reduce)
+    return " ".join(reviews_for_summary)
+
+
+def _format_top(counter: AspectCounter) -> str:
+    """Самые частые аспекты с числом упоминаний: 'battery (12), screen (7)'."""
+    return ', '.join(f"{aspect} ({count})" for aspect, count in counter.most_common(REPORT_TOP_ASPECTS))
+
+
+def _top_records(counter: AspectCounter) -> list:
+    """Самые частые аспекты для структурированного отчета."""
+    return [{'aspect': aspect, 'count': count} for aspect, count in counter.most_common(STRUCTURED_TOP_ASPECTS)]
+
+
+def _aspect_lines(row) -> list:
+    """Строки «Ключевые аспекты» для раздела продукта."""
+    aspect_summary = []
+    if row['positive_aspects']:
+        aspect_summary.append(f"Положительные отзывы упоминают: {_format_top(row['positive_aspects'])}")
+    if row['negative_aspects']:
+        aspect_summary.append(f"Негативные отзывы связаны с: {_format_top(row['negative_aspects'])}")
+    return aspect_summary
+
+
+def make_summary_policy(models: dict, tier: str = None, budget: float = None):
+    """
+    Политика декодирования сводок (см. DecodingPolicy): None без уровня и бюджета,
+    т.е. полный beam search. Дистиллированная модель берется из models['summarizer_fast'], если загружена.
+    """
+    if tier is None and budget is None:
+        return None
+    return DecodingPolicy(tier, budget, distilled=models.get('summarizer_fast'))
+
+
+def write_report(product_summary: pd.DataFrame, models: dict, writer: ReportWriter,
+                 summary_batch_size: int = 8, block_size: int = 256, summary_policy=None) -> None:
+    """
+    Записывает отчет по результатам aggregate_by_product в writer по мере готовности.
+    В отчет попадают продукты, у которых есть хотя бы один не нейтральный отзыв с аспектами,
+    в порядке появления такого отзыва.
+    Продукты обрабатываются блоками по block_size: тексты блока суммаризируются вместе,
+    пакетами по summary_batch_size, после чего разделы блока сразу пишутся на диск.
+    summary_policy — DecodingPolicy для выбора параметров декодирования по бюджету задержки.
+    """
+    product_summary = product_summary[product_summary['first_aspect_row'].notna()]
+    product_summary = product_summary.sort_values('first_aspect_row', kind='stable')
+
+    for start in range(0, len(product_summary), block_size):
+        block = product_summary.iloc[start:start + block_size]
+        # Собираем статистику по аспектам и тексты для суммаризации по продуктам блока
+        aspect_summaries = [_aspect_lines(row) for _, row in block.iterrows()]
+        summary_inputs = [_summary_input(row) for _, row in block.iterrows()]
+
+        # Суммаризация продуктов блока пакетами
+        to_summarize = [i for i, text in enumerate(summary_inputs) if text]
+        with metrics.stage('summarization', items=len(to_summarize), batch_size=summary_batch_size):
+            generated = summarize_long_texts(models['summarizer'], [summary_inputs[i] for i in to_summarize],
+                                             max_length=100, min_length=30, batch_size=summary_batch_size,
+                                             policy=summary_policy)
+        summaries = dict(zip(to_summarize, generated))
+
+        with metrics.stage('write_report', items=len(block)):
+            for i, (product, row) in enumerate(block.iterrows()):
+                aspect_summary = aspect_summaries[i]
+                if summaries.get(i) is not None:
+                    summary, source = summaries[i], 'model'
+                elif aspect_summary:
+                    # Если суммаризация не удалась, используем простое описание
+                    summary, source = " ".join(aspect_summary), 'aspects'
+                elif i in summaries:
+                    summary, source = "", 'none'
+                else:
+                    summary, source = "Недостаточно данных для анализа.", 'none'
+                writer.write_product({
+                    'product_id': product,
+                    'positive_reviews': int(row['positive_reviews']),
+                    'negative_reviews': int(row['negative_reviews']),
+                    'positive_aspects': _top_records(row['positive_aspects']),
+                    'negative_aspects': _top_records(row['negative_aspects']),
+                    'summary': summary,
+                    'summary_source': source,
+                }, aspect_summary)
+
+
+def build_report(product_summary: pd.DataFrame, models: dict, summary_batch_size: int = 8,
+                 summary_policy=None) -> str:
+    """Формирует текст отчета по результатам aggregate_by_product целиком в памяти (см. write_report)."""
+    buffer = io.StringIO()
+    write_report(product_summary, models, ReportWriter(text_stream=buffer), summary_batch_size=summary_batch_size,
+                 summary_policy=summary_policy)
+    return buffer.getvalue()
+
+
+def _finish_report(aggregates: pd.DataFrame, models: dict, summary_batch_size: int,
+                   writer: ReportWriter = None, summary_tier: str = None, summary_budget: float = None):
+    """Пишет отчет в writer (и возвращает None) или, без writer, возвращает текст отчета."""
     print("Анализ завершен. Генерация сводок (используется модуль GenAI-1-04)...")
-    
-    # Создаем словарь для хранения текстов отзывов по продуктам и тональности
-    product_reviews = defaultdict(lambda: defaultdict(list))
-    for index, row in reviews_df.iterrows():
-        product = row['product_id']
-        review_text = row['review_text']
-        sentiment = text_to_sentiment.get(review_text, 'NEUTRAL')
-        if sentiment != 'NEUTRAL':
-            product_reviews[product][sentiment].append(review_text)
-    
-    final_report = "--- Сводный отчет по анализу отзывов ---\n\n"
-    for product, sentiments in product_aspects.items():
-        final_report += f"Продукт: {product}\n"
-        
-        # Собираем статистику по аспектам
-        aspect_summary = []
-        if sentiments['positive']:
-            unique_positive = set(sentiments['positive'])
-            # Фильтруем странные токены из NER
-            clean_positive = [a for a in unique_positive if not a.startswith('##') and len(a) > 1]
-            if clean_positive:
-                aspect_summary.append(f"Положительные отзывы упоминают: {', '.join(sorted(clean_positive)[:5])}")
-        
-        if sentiments['negative']:
-            unique_negative = set(sentiments['negative'])
-            # Фильтруем странные токены из NER
-            clean_negative = [a for a in unique_negative if not a.startswith('##') and len(a) > 1]
-            if clean_negative:
-                aspect_summary.append(f"Негативные отзывы связаны с: {', '.join(sorted(clean_negative)[:5])}")
-        
-        # Собираем текст для суммаризации из реальных отзывов
-        reviews_for_summary = []
-        if product in product_reviews:
-            if product_reviews[product]['positive']:
-                reviews_for_summary.extend(product_reviews[product]['positive'][:2])
-            if product_reviews[product]['negative']:
-                reviews_for_summary.extend(product_reviews[product]['negative'][:2])
-        
-        if reviews_for_summary:
-            # Объединяем отзывы для суммаризации
-            combined_reviews = " ".join(reviews_for_summary)
-            
-            # Ограничиваем длину входного текста
-            words = combined_reviews.split()
-            if len(words) > 500:
-                combined_reviews = " ".join(words[:500])
-            
-            # Суммаризация
-            try:
-                summary = summarize_text(models['summarizer'], combined_reviews, 
-                                       max_length=100, min_length=30)
-            except Exception as e:
-                # Если суммаризация не удалась, используем простое описание
-                summary = " ".join(aspect_summary)
-        else:
-            summary = " ".join(aspect_summary) if aspect_summary else "Недостаточно данных для анализа."
-        
-        # Добавляем детали по аспектам
-        if aspect_summary:
-            final_report += f"Ключевые аспекты:\n"
-            for aspect in aspect_summary:
-                final_report += f"  - {aspect}\n"
-        
-        final_report += f"Краткая сводка: {summary}\n"
-        final_report += "-" * 50 + "\n\n"
-        
-    return final_report
+    policy = make_summary_policy(models, summary_tier, summary_budget)
+    if writer is None:
+        report = build_report(aggregates, models, summary_batch_size=summary_batch_size, summary_policy=policy)
+    else:
+        report = write_report(aggregates, models, writer, summary_batch_size=summary_batch_size,
+                              summary_policy=policy)
+    if policy is not None:
+        print(f"Декодирование сводок (вариант: пакетов): {policy.stats()['choices']}")
+    return report
+
+
+def generate_report(reviews_df: pd.DataFrame, models: dict, ner_batch_size: int = 16,
+                    summary_batch_size: int = 8, writer: ReportWriter = None,
+                    summary_tier: str = None, summary_budget: float = None, dedup_threshold: float = None):
+    """
+    Генерирует полный отчет на основе анализа отзывов, вызывая импортированные функции.
+    NER выполняется пакетами по ner_batch_size отзывов, суммаризация — по summary_batch_size продуктов.
+    Если передан writer, разделы отчета пишутся в него по мере готовности и функция возвращает None;
+    иначе возвращается текст отчета.
+    summary_tier и summary_budget (секунд на сводку) задают политику декодирования (см. DecodingPolicy).
+    dedup_threshold — порог сходства для поиска почти одинаковых отзывов (None — без поиска).
+    """
+    dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+    analyzed_df = analyze_reviews(reviews_df, models, ner_batch_size=ner_batch_size, dedup=dedup)
+    with metrics.stage('aggregate', items=len(analyzed_df)):
+        aggregates = aggregate_by_product(analyzed_df)
+    return _finish_report(aggregates, models, summary_batch_size, writer, summary_tier, summary_budget)
+
+
+# Состояние рабочего процесса параллельного режима: модели загружаются один раз при старте
+_worker_models = None
+_worker_ner_batch_size = 16
+_worker_store = None
+_worker_dedup = None
+
+
+def _init_worker(threads_per_worker: int, ner_batch_size: int, store_path: str = None, models_dir: str = None,
+                 dedup_threshold: float = None):
+    """
+    Инициализатор рабочего процесса: ограничивает потоки torch, загружает модели анализа
+    и открывает общее хранилище результатов.
+    """
+    global _worker_models, _worker_ner_batch_size, _worker_store, _worker_dedup
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    _worker_models = load_models(ANALYSIS_MODELS, models_dir)
+    _worker_ner_batch_size = ner_batch_size
+    _worker_store = AnalysisStore(store_path) if store_path else None
+    _worker_dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+
+
+def _analyze_chunk(chunk: pd.DataFrame, models: dict, ner_batch_size: int, store: AnalysisStore = None,
+                   dedup: NearDuplicateIndex = None):
+    """Анализ порции отзывов и агрегаты по продуктам."""
+    analyzed_df = analyze_reviews(chunk, models, ner_batch_size=ner_batch_size, store=store, dedup=dedup)
+    with metrics.stage('aggregate', items=len(analyzed_df)):
+        return aggregate_by_product(analyzed_df)
+
+
+def _aggregate_shard(chunk: pd.DataFrame) -> tuple:
+    """
+    Задача рабочего процесса: агрегаты порции и метрики процесса, накопленные с прошлой задачи
+    (включая загрузку моделей при старте).
+    """
+    aggregates = _analyze_chunk(chunk, _worker_models, _worker_ner_batch_size, _worker_store, _worker_dedup)
+    worker_metrics = metrics.to_dict()
+    metrics.reset()
+    return aggregates, worker_metrics
 
 
-def save_report(report: str, file_path: str):
-    """Сохраняет отчет в файл."""
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(report)
-    print(f"Отчет успешно сохранен в файл: {file_path}")
+def _collect(size: int, future) -> tuple:
+    """Дожидается задачи рабочего процесса и добавляет его метрики к метрикам основного процесса."""
+    aggregates, worker_metrics = future.result()
+    metrics.merge(worker_metrics)
+    return size, aggregates
+
+
+def _iter_parallel_aggregates(chunks, workers: int, threads_per_worker: int, ner_batch_size: int,
+                              store_path: str = None, models_dir: str = None, dedup_threshold: float = None):
+    """
+    Раздает порции отзывов пулу процессов и возвращает их агрегаты в исходном порядке.
+    В работе одновременно не более 2 * workers порций, чтобы не читать файл целиком в очередь.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(threads_per_worker, ner_batch_size, store_path, models_dir,
+                                       dedup_threshold)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((len(chunk), pool.submit(_aggregate_shard, chunk)))
+            if len(pending) >= 2 * workers:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+
+
+def generate_report_streaming(file_path: str, models: dict, chunk_size: int = 10000,
+                              engine: str = 'pandas', ner_batch_size: int = 16,
+                              workers: int = 1, threads_per_worker: int = None, store_path: str = None,
+                              summary_batch_size: int = 8, models_dir: str = None, writer: ReportWriter = None,
+                              summary_tier: str = None, summary_budget: float = None,
+                              dedup_threshold: float = None):
+    """
+    Генерирует отчет, читая CSV порциями по chunk_size строк.
+    В памяти хранятся только текущие порции и агрегаты по продуктам, поэтому
+    пиковое потребление памяти зависит от размера порции, а не от размера файла.
+
+    При workers > 1 порции анализируются в пуле процессов: каждый процесс один раз
+    загружает модели тональности и NER и использует threads_per_worker потоков torch
+    (по умолчанию ядра делятся поровну между процессами). Агрегаты объединяются здесь,
+    а models должен содержать только суммаризатор; models_dir передается рабочим процессам.
+
+    store_path — путь к AnalysisStore: результаты анализа сохраняются после каждой порции,
+    поэтому повторный или прерванный запуск анализирует только отсутствующие в нем отзывы.
+    writer, summary_tier, summary_budget и dedup_threshold — как в generate_report;
+    почти одинаковые отзывы ищутся только в пределах порции (копии из разных порций
+    не объединяются; со store точные копии из уже обработанных порций берутся из хранилища).
+    """
+    if workers < 1:
+        raise ValueError("workers должен быть положительным")
+    chunks = (chunk for chunk in iter_review_chunks(file_path, chunk_size=chunk_size, engine=engine)
+              if not chunk.empty)
+    if workers > 1:
+        threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        print(f"Параллельный режим: {workers} процессов по {threads_per_worker} потоков torch.")
+        chunk_aggregates = _iter_parallel_aggregates(chunks, workers, threads_per_worker, ner_batch_size,
+                                                     store_path, models_dir, dedup_threshold)
+        store = None
+    else:
+        store = AnalysisStore(store_path) if store_path else None
+        dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+        chunk_aggregates = ((len(chunk), _analyze_chunk(chunk, models, ner_batch_size, store, dedup))
+                            for chunk in chunks)
+
+    aggregates = None
+    total = 0
+    try:
+        for size, chunk_aggregate in chunk_aggregates:
+            with metrics.stage('merge_aggregates'):
+                aggregates = chunk_aggregate if aggregates is None else merge_aggregates(aggregates, chunk_aggregate)
+            total += size
+            print(f"Обработано отзывов: {total}")
+    finally:
+        if store is not None:
+            store.close()
+
+    if aggregates is None:
+        raise ValueError(f"CSV-файл '{file_path}' пустой.")
+    return _finish_report(aggregates, models, summary_batch_size, writer, summary_tier, summary_budget)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Комплексный анализ отзывов на продукты")
+    parser.add_argument("--input", default="reviews_data.csv", help="CSV-файл с отзывами")
+    parser.add_argument("--output", default="analysis_report.txt", help="Файл для отчета")
+    parser.add_argument("--structured-output", default=None,
+                        help="Машиночитаемый отчет по продуктам: .jsonl или .parquet (требуется pyarrow)")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="Читать CSV порциями по N строк (потоковый режим для больших файлов)")
+    parser.add_argument("--engine", choices=["pandas", "pyarrow"], default="pandas",
+                        help="Чтение CSV в потоковом режиме")
+    parser.add_argument("--ner-batch-size", type=int, default=16)
+    parser.add_argument("--summary-batch-size", type=int, default=8,
+                        help="Сколько сводок продуктов суммаризировать за один вызов модели")
+    parser.add_argument("--summary-tier", choices=DECODING_TIERS, default=None,
+                        help="Качество сводок: quality (4 луча, по умолчанию), balanced (2 луча), "
+                             "fast (жадное декодирование, дистиллированная модель)")
+    parser.add_argument("--summary-budget-ms", type=float, default=None,
+                        help="Бюджет задержки на сводку продукта, мс: параметры декодирования "
+                             "подбираются по измеренной скорости")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Число процессов для анализа отзывов (каждый загружает свои модели)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Потоков torch на процесс (по умолчанию ядра делятся поровну)")
+    parser.add_argument("--store", default=None,
+                        help="SQLite-хранилище результатов анализа: повторные запуски анализируют только новые отзывы")
+    parser.add_argument("--dedup", nargs="?", type=float, const=0.85, default=None, metavar="THRESHOLD",
+                        help="Анализировать почти одинаковые отзывы один раз (MinHash/LSH); "
+                             "THRESHOLD — минимальное сходство по Жаккару, по умолчанию 0.85")
+    parser.add_argument("--models-dir", default=None,
+                        help="Каталог с локальными копиями моделей (<org>/<name> или <name>)")
+    parser.add_argument("--metrics-out", default=None,
+                        help="JSON-файл с метриками по этапам: время, отзывов/с, размеры пакетов, RSS")
+    parser.add_argument("--profile", default=None, help="Сохранить профиль выполнения в файл")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="Профайлер для --profile")
+    args = parser.parse_args()
+    if args.chunk_size is not None and args.chunk_size < 1:
+        parser.error("--chunk-size должен быть положительным")
+    if args.structured_output and not args.structured_output.lower().endswith(('.jsonl', '.parquet')):
+        parser.error("--structured-output должен иметь расширение .jsonl или .parquet")
+    if args.workers < 1:
+        parser.error("--workers должен быть положительным")
+    if args.ner_batch_size < 1 or args.summary_batch_size < 1:
+        parser.error("размеры пакетов должны быть положительными")
+    if args.dedup is not None and not 0 < args.dedup <= 1:
+        parser.error("порог --dedup должен быть в интервале (0, 1]")
+    if args.summary_budget_ms is not None and args.summary_budget_ms <= 0:
+        parser.error("--summary-budget-ms должен быть положительным")
+    if args.threads_per_worker is not None and args.threads_per_worker < 1:
+        parser.error("--threads-per-worker должен быть положительным")
+    if (args.workers > 1 or args.store) and args.chunk_size is None:
+        # Параллельный режим и хранилище (чекпоинт после каждой порции) работают через порции:
+        # по умолчанию порция — 1000 отзывов
+        args.chunk_size = 1000
+    return args
 
 
 def main():
     """Главная функция-оркестратор."""
-    REVIEWS_FILE = "reviews_data.csv"
-    REPORT_FILE = "analysis_report.txt"
+    args = parse_args()
+    try:
+        with profiled(args.profile, args.profiler):
+            run(args)
+    finally:
+        # Метрики сохраняются и при ошибке: они помогают понять, на каком этапе она произошла
+        if args.metrics_out:
+            metrics.save(args.metrics_out)
+            print(f"Метрики сохранены в файл: {args.metrics_out}")
+        if args.profile:
+            print(f"Профиль сохранен в файл: {args.profile}")
+
+
+def _report_saved(args):
+    print(f"Отчет успешно сохранен в файл: {args.output}")
+    if args.structured_output:
+        print(f"Структурированный отчет сохранен в файл: {args.structured_output}")
+    if args.dedup is not None:
+        print_dedup_summary()
+
 
-    # Сначала проверяем файл, потом загружаем модели
-    reviews_df = load_reviews(REVIEWS_FILE)
+def print_dedup_summary() -> None:
+    """
+    Печатает долю почти одинаковых отзывов и сэкономленные вызовы моделей анализа.
+    Со store учитываются только отзывы, которых не было в хранилище.
+    """
+    reviews = metrics.counters.get('dedup_reviews', 0)
+    duplicates = metrics.counters.get('dedup_duplicates', 0)
+    hit_rate = duplicates / reviews if reviews else 0.0
+    print(f"Почти одинаковые отзывы: {duplicates} из {reviews} анализируемых ({hit_rate:.1%}); "
+          f"сэкономлено вызовов моделей: {duplicates * len(ANALYSIS_MODELS)} "
+          f"({', '.join(ANALYSIS_MODELS)} по {duplicates})")
+
+
+def _summary_budget(args):
+    """Бюджет задержки на сводку в секундах (None, если не задан)."""
+    return None if args.summary_budget_ms is None else args.summary_budget_ms / 1000
+
+
+def run(args):
+    """Выполняет анализ отзывов с параметрами командной строки."""
+    # Сначала дешевые проверки файла, чтобы не загружать модели зря
+    error = check_reviews_file(args.input)
+    if error:
+        print(f"Ошибка: {error}", file=sys.stderr)
+        return
+
+    # Все модели загружаются в фоне параллельно друг другу и чтению отзывов.
+    # В параллельном режиме модели анализа загружаются в рабочих процессах.
+    names = ('summarizer',) if args.workers > 1 else MODEL_NAMES
+    if args.summary_tier == 'fast' or args.summary_budget_ms is not None:
+        # Дистиллированный суммаризатор нужен только политике декодирования
+        names += ('summarizer_fast',)
+    print(f"Загрузка моделей в фоне: {', '.join(names)}...")
+    models = BackgroundModels(names, args.models_dir)
+
+    if args.chunk_size is not None:
+        # Потоковый режим: отзывы читаются порциями
+        try:
+            with ReportWriter(args.output, args.structured_output) as writer:
+                generate_report_streaming(args.input, models, chunk_size=args.chunk_size,
+                                          engine=args.engine, ner_batch_size=args.ner_batch_size,
+                                          workers=args.workers, threads_per_worker=args.threads_per_worker,
+                                          store_path=args.store, summary_batch_size=args.summary_batch_size,
+                                          models_dir=args.models_dir, writer=writer,
+                                          summary_tier=args.summary_tier, summary_budget=_summary_budget(args),
+                                          dedup_threshold=args.dedup)
+            _report_saved(args)
+        except Exception as e:
+            print(f"Ошибка при генерации отчета: {e}", file=sys.stderr)
+            sys.exit(1)
+        print_startup_breakdown(models)
+        return
+
+    reviews_df = load_reviews(args.input)
     if reviews_df is None:
         return
     
     print(f"Загружено {len(reviews_df)} отзывов.")
     
-    models = load_models()
-    
     try:
-        report = generate_report(reviews_df, models)
-        save_report(report, REPORT_FILE)
+        with ReportWriter(args.output, args.structured_output) as writer:
+            generate_report(reviews_df, models, ner_batch_size=args.ner_batch_size,
+                            summary_batch_size=args.summary_batch_size, writer=writer,
+                            summary_tier=args.summary_tier, summary_budget=_summary_budget(args),
+                            dedup_threshold=args.dedup)
+        _report_saved(args)
     except Exception as e:
         print(f"Ошибка при генерации отчета: {e}", file=sys.stderr)
         sys.exit(1)
+    print_startup_breakdown(models)
 
 
 if __name__ == "__main__":
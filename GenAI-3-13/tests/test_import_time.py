@@ -0,0 +1,21 @@
+"""
+Регрессия времени импорта точек входа (см. check_import_time.py).
+
+Запуск: python -m pytest -q tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_import_time import DEFAULT_BUDGET_MS, check  # noqa: E402
+
+
+def test_entry_points_fit_import_budget():
+    results = check(DEFAULT_BUDGET_MS)
+
+    heavy = {name: modules for name, _, modules, _ in results if modules}
+    assert not heavy, f"Тяжелые модули импортируются при старте: {heavy}"
+    slow = {name: round(elapsed, 1) for name, elapsed, _, ok in results if not ok}
+    assert not slow, f"Время импорта сверх бюджета {DEFAULT_BUDGET_MS} мс: {slow}"
@@ -0,0 +1,45 @@
+"""
+Проверки объединения агрегатов порций отзывов (merge_aggregates).
+
+Запуск: python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from review_integrator import AGGREGATE_COLUMNS, aggregate_by_product, merge_aggregates  # noqa: E402
+
+
+def _analyzed(rows, start=0):
+    """Результат analyze_reviews для порции: (product_id, sentiment, aspects)."""
+    frame = pd.DataFrame(rows, columns=['product_id', 'sentiment', 'aspects'])
+    frame['review_text'] = [f"review {i}" for i in range(start, start + len(frame))]
+    frame['confidence'] = 0.9
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    return frame
+
+
+def test_merge_of_only_neutral_chunks_is_empty():
+    first = aggregate_by_product(_analyzed([('p1', 'neutral', [])]))
+    second = aggregate_by_product(_analyzed([('p2', 'neutral', ['Battery'])], start=1))
+    assert first.empty and second.empty
+
+    merged = merge_aggregates(first, second)
+
+    assert merged.empty
+    assert list(merged.columns) == AGGREGATE_COLUMNS
+
+
+def test_leading_neutral_chunks_do_not_affect_later_ones():
+    neutral = aggregate_by_product(_analyzed([('p1', 'neutral', [])]))
+    opinionated = aggregate_by_product(_analyzed([('p9', 'positive', ['Battery'])], start=1))
+
+    merged = merge_aggregates(merge_aggregates(neutral, neutral), opinionated)
+
+    assert list(merged.index) == ['p9']
+    assert merged.loc['p9', 'positive_reviews'] == 1
+    assert merged.loc['p9', 'positive_aspects'].most_common(1) == [('Battery', 1)]
@@ -0,0 +1,47 @@
+"""
+Проверки чтения CSV с отзывами (check_reviews_file, load_reviews, iter_review_chunks).
+
+Запуск: python -m pytest -q tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from review_integrator import check_reviews_file, iter_review_chunks, load_reviews  # noqa: E402
+
+# Пробел после запятой в заголовке: 'product_id, review_text'
+SPACED_HEADER_CSV = "product_id, review_text\np1, Great battery\np2, Bad screen\np1, Fast charging\n"
+
+
+@pytest.fixture
+def spaced_header_file(tmp_path):
+    path = tmp_path / "reviews.csv"
+    path.write_text(SPACED_HEADER_CSV, encoding="utf-8")
+    return str(path)
+
+
+def test_spaced_header_is_accepted_in_memory(spaced_header_file):
+    assert check_reviews_file(spaced_header_file) is None
+
+    df = load_reviews(spaced_header_file)
+
+    assert df['product_id'].tolist() == ['p1', 'p2', 'p1']
+    assert df['review_text'].tolist() == ['Great battery', 'Bad screen', 'Fast charging']
+
+
+@pytest.mark.parametrize('engine', ['pandas', 'pyarrow'])
+def test_spaced_header_is_accepted_by_chunk_engines(spaced_header_file, engine):
+    if engine == 'pyarrow':
+        pytest.importorskip('pyarrow')
+
+    chunks = list(iter_review_chunks(spaced_header_file, chunk_size=2, engine=engine))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert list(chunks[1].index) == [2]
+    assert all(list(chunk.columns) == ['product_id', 'review_text'] for chunk in chunks)
+    assert [text for chunk in chunks for text in chunk['review_text']] == \
+        ['Great battery', 'Bad screen', 'Fast charging']